@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Headless gesture extraction over recorded videos.
+
+Videos are split into frame ranges and spread over a process pool, each worker
+owning one HandDetector (one MediaPipe Hands instance). The per-frame gesture
+timeline is streamed out as CSV in file and frame order. Nothing here imports Qt.
+
+Usage : python BatchGestureExtractor.py video1.mp4 video2.mp4 -o timeline.csv
+"""
+
+import os
+import sys
+import csv
+import argparse
+import functools
+import cv2
+from concurrent.futures import ProcessPoolExecutor
+from HandDetector import HandDetector
+
+# Constants
+DEFAULT_CHUNK_FRAMES   = 500
+DEFAULT_DETECTION_CON  = 0.7
+TIMELINE_COLUMNS       = ["video", "frame", "timestamp_ms", "hand_direction", "hand_position"]
+
+# HandDetector of the current worker process, created by initWorker
+workerDetector = None
+
+
+def initWorker(detectionCon):
+    global workerDetector
+    workerDetector = HandDetector(detectionCon=detectionCon)
+
+
+def countFrames(videoPath):
+    cap = cv2.VideoCapture(videoPath)
+    frameCount = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return frameCount
+
+
+def shardVideos(videoPaths, chunkFrames=DEFAULT_CHUNK_FRAMES):
+    # (videoPath, startFrame, endFrame) ranges; endFrame None means until the end of the file
+    for videoPath in videoPaths:
+        frameCount = countFrames(videoPath)
+        if frameCount <= 0:
+            yield videoPath, 0, None
+            continue
+
+        for startFrame in range(0, frameCount, chunkFrames):
+            yield videoPath, startFrame, min(startFrame + chunkFrames, frameCount)
+
+
+def extractShard(shard, flip=True):
+    videoPath, startFrame, endFrame = shard
+    rows = []
+
+    # tracking state must not leak from the previous shard
+    workerDetector.hands.reset()
+
+    cap = cv2.VideoCapture(videoPath)
+    if startFrame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, startFrame)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    frameNo = startFrame
+    while endFrame is None or frameNo < endFrame:
+        success, image = cap.read()
+        if not success:
+            break
+
+        timestamp = cap.get(cv2.CAP_PROP_POS_MSEC)
+        if timestamp <= 0 and frameNo > 0 and fps > 0:
+            timestamp = frameNo * 1000.0 / fps
+
+        # same mirroring as the live camera path in MediaPlayer
+        if flip:
+            image = cv2.flip(image, 1)
+
+        workerDetector.detectHands(image, draw=False)
+        rows.append((videoPath, frameNo, round(timestamp, 3),
+                     workerDetector.handDirection, workerDetector.getHandPosition()))
+        frameNo += 1
+
+    cap.release()
+    return rows
+
+
+def extractGestureTimeline(videoPaths, workers=None, chunkFrames=DEFAULT_CHUNK_FRAMES,
+                           detectionCon=DEFAULT_DETECTION_CON, flip=True):
+    # yields timeline rows in video/frame order while later shards are still running
+    shards = list(shardVideos(videoPaths, chunkFrames))
+    with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(detectionCon,)) as executor:
+        for rows in executor.map(functools.partial(extractShard, flip=flip), shards):
+            yield from rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract a per-frame gesture timeline from video files.")
+    parser.add_argument("videos", nargs="+", help="video files to process")
+    parser.add_argument("-o", "--output", default="-", help="CSV file to write, '-' for stdout")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--chunk-frames", type=int, default=DEFAULT_CHUNK_FRAMES, help="frames per shard")
+    parser.add_argument("--detection-con", type=float, default=DEFAULT_DETECTION_CON, help="minimum detection confidence")
+    parser.add_argument("--no-flip", action="store_true", help="do not mirror frames before detection")
+    args = parser.parse_args(argv)
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    try:
+        writer = csv.writer(output)
+        writer.writerow(TIMELINE_COLUMNS)
+        for row in extractGestureTimeline(args.videos, args.workers, args.chunk_frames,
+                                          args.detection_con, not args.no_flip):
+            writer.writerow(row)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
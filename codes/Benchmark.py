@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark of the gesture pipeline, no camera needed.
+
+* clips : every video in benchmark_clips/ is replayed through detectHands and
+  getHandPosition (decode, detect and classify stages). gestures.mp4 has a
+  real hand making the gestures, living_room.mp4 a room without hands. Each
+  clip runs with a plain detector and with the configuration the player ships
+  (motion gate, hand tracking, downscaled search and quality controller).
+  FPS and latency are timed in one pass, the transient heap is measured with
+  tracemalloc in a second one.
+* synthetic : MediaPipe shaped landmark fixtures are fed straight into
+  findLandMarks and getHandPosition to time landmark extraction and the
+  classifier in isolation, and classifyHands is timed on batches of hands.
+  The fixtures also drive the dynamic gesture detector with a long window,
+  whose cost per frame must not grow with the window length.
+
+FPS, frames with a hand, per-stage p50/p95/p99 latency, transient heap per
+frame and peak RSS are reported and compared with a stored baseline. The exit
+status is 1 when a metric regressed by more than the tolerance.
+benchmark_baseline.json is a reference run; timings depend on the machine, so
+store your own with --save-baseline before comparing.
+
+Usage : python Benchmark.py [--save-baseline] [--baseline benchmark_baseline.json]
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import platform
+import numpy as np
+import cv2
+from HandDetector import HandDetector
+from MotionGate import MotionGate
+from QualityController import QualityController, DEFAULT_TARGET_FPS, DEFAULT_P95_BUDGET_MS
+from FrameBuffers import AllocationProbe
+from SyntheticHands import syntheticFixtures, syntheticResults
+from DynamicGestures import DynamicGestureDetector
+
+# Constants
+BENCHMARK_DIR          = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CLIPS_DIR      = os.path.join(BENCHMARK_DIR, "benchmark_clips")
+DEFAULT_BASELINE_FILE  = os.path.join(BENCHMARK_DIR, "benchmark_baseline.json")
+CLIP_PATTERNS          = ["*.mp4", "*.avi", "*.mkv"]
+DETECTION_CON          = 0.7
+PLAYER_SEARCH_SIZE     = 320      # SEARCH_FRAME_SIZE of MediaPlayer, GestureDaemon and MultiCamera
+VARIANT_PLAIN          = "plain"
+VARIANT_PLAYER         = "player"
+CLIP_VARIANTS          = [VARIANT_PLAIN, VARIANT_PLAYER]
+SYNTHETIC_FIXTURES     = 240
+SYNTHETIC_ROUNDS       = 50
+SYNTHETIC_FRAME_SHAPE  = (480, 640, 3)
+SYNTHETIC_BATCH_SIZE   = 4        # hands per classifyHands call
+SYNTHETIC_WINDOW       = 256      # frames in the dynamic gesture window
+SYNTHETIC_FRAME_TIME   = 1.0 / 30
+DEFAULT_TOLERANCE      = 0.25
+CLIP_MIN_DELTA_MS      = 0.5      # clips have few frames, ignore smaller latency changes
+GATED_PERCENTILES      = ["p50", "p95"]   # p99 follows scheduler hiccups (a clip's slowest frame), reported only
+SYNTHETIC_MIN_DELTA_MS = 0.005    # scheduler noise on stages of a few microseconds
+HAND_FRAMES_TOLERANCE  = 0.05     # detection does not depend on the load, a few lost hands already count
+PERCENTILES            = [50, 95, 99]
+
+
+class StageTimes():
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds * 1000.0)
+
+    def summary(self):
+        # stage -> {"p50": ms, "p95": ms, "p99": ms}
+        result = {}
+        for stage, samples in self.samples.items():
+            values = np.percentile(np.asarray(samples), PERCENTILES)
+            result[stage] = {"p%d" % p: round(float(v), 4) for p, v in zip(PERCENTILES, values)}
+        return result
+
+
+def peakRssMb():
+    try:
+        import resource
+    except ImportError:
+        # not available on Windows
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0), 1)
+
+
+def createDetector(variant, motionGate=False):
+    # (HandDetector, QualityController or None) of a clip variant
+    if variant == VARIANT_PLAYER:
+        handDetector = HandDetector(detectionCon=DETECTION_CON, motionGate=MotionGate(), roiTracking=True,
+                                    searchSize=PLAYER_SEARCH_SIZE)
+        return handDetector, QualityController(DEFAULT_TARGET_FPS, DEFAULT_P95_BUDGET_MS)
+    return HandDetector(detectionCon=DETECTION_CON, motionGate=MotionGate() if motionGate else None), None
+
+
+def replayClip(clipPath, handDetector, stageTimes=None, probe=None, qualityController=None):
+    # (frames, frames with a hand) of one pass over the clip, the quality controller is fed like InferenceStage does
+    cap        = cv2.VideoCapture(clipPath)
+    frame      = None
+    frames     = 0
+    handFrames = 0
+
+    while True:
+        if probe is not None:
+            probe.frameStart()
+        t0 = time.perf_counter()
+        success, frame = cap.read(image=frame)
+        if not success:
+            break
+        if qualityController is not None:
+            qualityController.apply(handDetector)
+        t1 = time.perf_counter()
+        handDetector.detectHands(frame, draw=False)
+        t2 = time.perf_counter()
+        if qualityController is not None and not handDetector.inferenceSkipped:
+            qualityController.record((t2 - t1) * 1000.0)
+        handDetector.getHandPosition()
+        t3 = time.perf_counter()
+        if probe is not None:
+            probe.frameEnd()
+
+        if stageTimes is not None:
+            stageTimes.add("decode", t1 - t0)
+            stageTimes.add("detect", t2 - t1)
+            stageTimes.add("classify", t3 - t2)
+        frames     += 1
+        handFrames += len(handDetector.handDirections) > 0
+
+    cap.release()
+    return frames, handFrames
+
+
+def benchmarkClip(clipPath, variant=VARIANT_PLAIN, motionGate=False):
+    # timed with tracemalloc off, which slows every allocation down : the heap is measured in a second pass
+    handDetector, qualityController = createDetector(variant, motionGate)
+    stageTimes   = StageTimes()
+    startTime    = time.perf_counter()
+    frames, handFrames = replayClip(clipPath, handDetector, stageTimes, qualityController=qualityController)
+    elapsed      = time.perf_counter() - startTime
+    handDetector.close()
+
+    handDetector, qualityController = createDetector(variant, motionGate)
+    probe        = AllocationProbe()
+    probe.start()
+    replayClip(clipPath, handDetector, probe=probe, qualityController=qualityController)
+    probe.stop()
+    handDetector.close()
+
+    return {
+        "frames"            : frames,
+        "hand_frames"       : handFrames,
+        "fps"               : round(frames / elapsed, 2) if frames else 0.0,
+        "stages"            : stageTimes.summary(),
+        "transient_kb_frame": round(probe.bytesPerFrame() / 1024.0, 1),
+    }
+
+
+def benchmarkSynthetic(fixtureCount=SYNTHETIC_FIXTURES, rounds=SYNTHETIC_ROUNDS):
+    # the model is never called : only findLandMarks and the classifier are exercised
+    handDetector = HandDetector()
+    stageTimes   = StageTimes()
+    image        = np.zeros(SYNTHETIC_FRAME_SHAPE, dtype=np.uint8)
+    fixtures     = syntheticFixtures(fixtureCount)
+    results      = [syntheticResults([(landmarks, direction)], image.shape) for landmarks, direction, gesture in fixtures]
+    mismatches   = 0
+
+    startTime = time.perf_counter()
+    for roundNo in range(rounds):
+        for fixtureResults, (landmarks, direction, gesture) in zip(results, fixtures):
+            t0 = time.perf_counter()
+            handDetector.results = fixtureResults
+            handDetector.findLandMarks(image, draw=False)
+            t1 = time.perf_counter()
+            handPosition = handDetector.getHandPosition()
+            t2 = time.perf_counter()
+
+            stageTimes.add("landmarks", t1 - t0)
+            stageTimes.add("classify", t2 - t1)
+            mismatches += handPosition != gesture
+    elapsed = time.perf_counter() - startTime
+    
+    for roundNo in range(rounds):
+        for first in range(0, len(fixtures), SYNTHETIC_BATCH_SIZE):
+            batch = fixtures[first:first + SYNTHETIC_BATCH_SIZE]
+            handLandmarks = np.array([landmarks for landmarks, direction, gesture in batch])
+            t0 = time.perf_counter()
+            handPositions = handDetector.classifyHands(handLandmarks, [direction for landmarks, direction, gesture in batch])
+            stageTimes.add("classifyHands", time.perf_counter() - t0)
+            mismatches += sum(position != gesture for position, (landmarks, direction, gesture) in zip(handPositions, batch))
+    handDetector.hands.close()
+    
+    dynamicGestures = DynamicGestureDetector(windowFrames=SYNTHETIC_WINDOW)
+    for frameNo in range(rounds * len(fixtures)):
+        landmarks = fixtures[frameNo % len(fixtures)][0]
+        t0 = time.perf_counter()
+        dynamicGestures.update(landmarks, SYNTHETIC_FRAME_SHAPE[1], frameNo * SYNTHETIC_FRAME_TIME)
+        stageTimes.add("dynamic", time.perf_counter() - t0)
+
+    count = rounds * len(fixtures)
+    return {
+        "hands"      : count,
+        "hands_per_s": round(count / elapsed, 1),
+        "mismatches" : mismatches,
+        "stages"     : stageTimes.summary(),
+    }
+
+
+def flattenMetrics(report):
+    # name -> (value, higher is better, smallest change worth reporting, tolerance or None for the default)
+    metrics = {}
+    for clipName, variants in report["clips"].items():
+        for variant, clip in variants.items():
+            prefix = "clips/%s/%s" % (clipName, variant)
+            metrics[prefix + "/fps"] = (clip["fps"], True, 0.0, None)
+            metrics[prefix + "/hand_frames"] = (clip["hand_frames"], True, 0.0, HAND_FRAMES_TOLERANCE)
+            for stage, percentiles in clip["stages"].items():
+                for name in GATED_PERCENTILES:
+                    metrics["%s/%s/%s" % (prefix, stage, name)] = (percentiles[name], False, CLIP_MIN_DELTA_MS, None)
+
+    synthetic = report["synthetic"]
+    metrics["synthetic/hands_per_s"] = (synthetic["hands_per_s"], True, 0.0, None)
+    for stage, percentiles in synthetic["stages"].items():
+        for name in GATED_PERCENTILES:
+            metrics["synthetic/%s/%s" % (stage, name)] = (percentiles[name], False, SYNTHETIC_MIN_DELTA_MS, None)
+    return metrics
+
+
+def compareWithBaseline(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    # list of (metric, baseline value, current value, change) which got worse than the tolerance
+    current     = flattenMetrics(report)
+    regressions = []
+    for name, (baseValue, higherIsBetter, minDelta, metricTolerance) in flattenMetrics(baseline).items():
+        if name not in current or baseValue == 0:
+            continue
+
+        value  = current[name][0]
+        if abs(value - baseValue) < minDelta:
+            continue
+        change = (value - baseValue) / baseValue
+        limit  = tolerance if metricTolerance is None else metricTolerance
+        if (higherIsBetter and change < -limit) or (not higherIsBetter and change > limit):
+            regressions.append((name, baseValue, value, change))
+    return regressions
+
+
+def runBenchmarks(clipsDir=DEFAULT_CLIPS_DIR, motionGate=False):
+    clipPaths = sorted(path for pattern in CLIP_PATTERNS for path in glob.glob(os.path.join(clipsDir, pattern)))
+    report = {
+        "machine"  : {"platform": platform.platform(), "python": platform.python_version(),
+                      "cpu_count": os.cpu_count(), "opencv": cv2.__version__},
+        "clips"    : {os.path.basename(path): {variant: benchmarkClip(path, variant, motionGate) for variant in CLIP_VARIANTS}
+                      for path in clipPaths},
+        "synthetic": benchmarkSynthetic(),
+    }
+    report["peak_rss_mb"] = peakRssMb()
+    return report
+
+
+def printReport(report):
+    for clipName, variants in report["clips"].items():
+        for variant, clip in variants.items():
+            print("%s (%s) : %d frames, %d with a hand, %.1f FPS, %.1f KiB transient heap per frame" % (
+                clipName, variant, clip["frames"], clip["hand_frames"], clip["fps"], clip["transient_kb_frame"]))
+            for stage, percentiles in clip["stages"].items():
+                print("    %-13s p50 %8.3f ms   p95 %8.3f ms   p99 %8.3f ms" % (
+                    stage, percentiles["p50"], percentiles["p95"], percentiles["p99"]))
+
+    synthetic = report["synthetic"]
+    print("synthetic : %d hands, %.0f hands/s, %d mismatches" % (
+        synthetic["hands"], synthetic["hands_per_s"], synthetic["mismatches"]))
+    for stage, percentiles in synthetic["stages"].items():
+        print("    %-13s p50 %8.4f ms   p95 %8.4f ms   p99 %8.4f ms" % (
+            stage, percentiles["p50"], percentiles["p95"], percentiles["p99"]))
+
+    print("peak RSS : %s MB" % report["peak_rss_mb"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the gesture pipeline.")
+    parser.add_argument("--clips", default=DEFAULT_CLIPS_DIR, help="directory of video clips to replay")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_FILE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed relative regression")
+    parser.add_argument("--motion-gate", action="store_true", help="replay clips with the motion gate enabled in the plain variant")
+    parser.add_argument("--output", help="write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    report = runBenchmarks(args.clips, args.motion_gate)
+    printReport(report)
+
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            json.dump(report, outputFile, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baselineFile:
+            json.dump(report, baselineFile, indent=2)
+        print("baseline saved to %s" % args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("no baseline at %s, run with --save-baseline to create one" % args.baseline)
+        return 0
+
+    with open(args.baseline) as baselineFile:
+        baseline = json.load(baselineFile)
+    if baseline.get("machine") != report["machine"]:
+        print("baseline %s comes from another machine (%s), timings may not compare" % (
+            args.baseline, baseline.get("machine", {}).get("platform")))
+
+    regressions = compareWithBaseline(report, baseline, args.tolerance)
+    for name, baseValue, value, change in regressions:
+        print("REGRESSION %s : %.4f -> %.4f (%+.0f%%)" % (name, baseValue, value, change * 100))
+    if report["synthetic"]["mismatches"]:
+        print("REGRESSION synthetic fixtures : %d hands classified differently" % report["synthetic"]["mismatches"])
+
+    if regressions or report["synthetic"]["mismatches"]:
+        return 1
+    print("no regression against %s" % args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Low latency capture : a grabber thread which keeps only the newest frame.
+
+cv2.VideoCapture buffers several frames in the backend, so a reader which is
+slower than the camera gets frames which are already a few ticks old.
+CameraCapture opens cameras through V4L2 on Linux, asks for MJPEG (YUYV when
+the camera has no MJPEG), the frame size and rate and a single driver buffer,
+then grabs continuously in its own thread. read() returns the newest frame
+only, stamped with the time.monotonic() moment it was grabbed, and the age of
+every frame handed out is recorded as the "frameAge" stage. The frame can be
+mirrored straight out of the grab buffer into the caller's buffer, so it is
+copied only once; the time spent waiting for a new frame ("frameWait") and
+the copy itself ("copy") are recorded apart.
+
+Video files can stand in for a camera : they are played at their own frame
+rate and start over at the end, and openCamera falls back to one when the
+camera cannot be opened.
+"""
+
+import sys
+import time
+import logging
+import threading
+import cv2
+
+# Constants
+FOURCC_PREFERENCE     = ["MJPG", "YUYV"]
+DRIVER_BUFFER_SIZE    = 1
+DEFAULT_CAMERA_FPS    = 30
+DEFAULT_VIDEO_FPS     = 30.0
+READ_TIMEOUT          = 1.0         # seconds without a new frame before read() fails
+CAPTURE_RETRY_DELAY   = 0.01
+
+logger = logging.getLogger(__name__)
+
+
+def parseCameraSource(source):
+    # "0" is a device index, anything else a video file
+    return int(source) if str(source).isdigit() else source
+
+
+def decodeFourcc(value):
+    code = int(value)
+    return "".join(chr((code >> shift) & 0xFF) for shift in (0, 8, 16, 24)).strip("\0")
+
+
+def openDevice(index):
+    # V4L2 on Linux so the buffer size and pixel format can be set, any backend elsewhere
+    if sys.platform.startswith("linux"):
+        cap = cv2.VideoCapture(index, cv2.CAP_V4L2)
+        if cap.isOpened():
+            return cap
+        cap.release()
+    return cv2.VideoCapture(index)
+
+
+def negotiateFormat(cap, width, height, fps):
+    # the pixel format has to be chosen before the frame size, the driver may adjust any of them
+    for fourcc in FOURCC_PREFERENCE:
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        if decodeFourcc(cap.get(cv2.CAP_PROP_FOURCC)) == fourcc:
+            break
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH,  width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    cap.set(cv2.CAP_PROP_FPS,          fps)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE,   DRIVER_BUFFER_SIZE)
+
+    return (decodeFourcc(cap.get(cv2.CAP_PROP_FOURCC)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), cap.get(cv2.CAP_PROP_FPS), int(cap.get(cv2.CAP_PROP_BUFFERSIZE)))
+
+
+class CameraCapture():
+
+    def __init__(self, cap, source, metrics=None):
+        # cap is an opened cv2.VideoCapture, source its device index or video file
+        self.cap           = cap
+        self.source        = source
+        self.metrics       = metrics
+        self.isFile        = not isinstance(source, int)
+        fps = cap.get(cv2.CAP_PROP_FPS) if self.isFile else 0
+        self.frameTime     = 1.0 / (fps if fps > 0 else DEFAULT_VIDEO_FPS)
+
+        # the grabber fills one buffer while the other holds the newest frame
+        self.buffers       = [None, None]
+        self.latest        = 0
+        self.latestId      = 0
+        self.latestTime    = 0.0
+        self.condition     = threading.Condition()
+        self.stopEvent     = threading.Event()
+
+        # frame returned by the last read()
+        self.frameId       = 0
+        self.captureTime   = 0.0
+        self.skippedFrames = 0
+
+        self.grabber = threading.Thread(target=self.grabFrames, name="CameraCapture-%s" % source, daemon=True)
+        if cap.isOpened():
+            self.grabber.start()
+
+    def grabFrames(self):
+        nextFrameTime = time.monotonic()
+        while not self.stopEvent.is_set():
+            if self.isFile:
+                time.sleep(max(0.0, nextFrameTime - time.monotonic()))
+                nextFrameTime = max(nextFrameTime + self.frameTime, time.monotonic() - self.frameTime)
+
+            startTime = time.perf_counter()
+            if not self.cap.grab():
+                if self.isFile:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                time.sleep(CAPTURE_RETRY_DELAY)
+                continue
+
+            # the frame left the driver when grab returned, decoding comes after
+            captureTime = time.monotonic()
+            spare = 1 - self.latest
+            success, frame = self.cap.retrieve(self.buffers[spare])
+            if not success:
+                continue
+            self.buffers[spare] = frame
+            if self.metrics is not None:
+                self.metrics.record("grab", time.perf_counter() - startTime)
+
+            with self.condition:
+                self.latest      = spare
+                self.latestId   += 1
+                self.latestTime  = captureTime
+                self.condition.notify_all()
+
+    def read(self, image=None, flipCode=None):
+        # newest frame not returned yet, copied into image when its shape fits, like cv2.VideoCapture.read
+        # with flipCode the copy is cv2.flip(frame, flipCode), the grab buffer is not copied twice
+        startTime = time.perf_counter()
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.latestId > self.frameId or self.stopEvent.is_set(),
+                                           READ_TIMEOUT) or self.stopEvent.is_set():
+                return False, image
+
+            copyTime = time.perf_counter()
+            frame = self.buffers[self.latest]
+            if image is not None and image.shape != frame.shape:
+                image = None
+            if flipCode is not None:
+                image = cv2.flip(frame, flipCode, dst=image)
+            elif image is None:
+                image = frame.copy()
+            else:
+                image[...] = frame
+            self.skippedFrames += self.latestId - self.frameId - 1
+            self.frameId     = self.latestId
+            self.captureTime = self.latestTime
+
+        if self.metrics is not None:
+            endTime = time.perf_counter()
+            self.metrics.record("frameWait", copyTime - startTime)
+            self.metrics.record("copy", endTime - copyTime)
+            self.metrics.record("frameAge", time.monotonic() - self.captureTime)
+        return True, image
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, propertyId):
+        return self.cap.get(propertyId)
+
+    def release(self):
+        self.stopEvent.set()
+        with self.condition:
+            self.condition.notify_all()
+        if self.grabber.is_alive():
+            self.grabber.join()
+        self.cap.release()
+
+
+def openCamera(source, width, height, fps=DEFAULT_CAMERA_FPS, metrics=None, fallbackFile=None):
+    # CameraCapture of a device index or video file, of fallbackFile when the device cannot be opened
+    startTime = time.monotonic()
+    source    = parseCameraSource(source)
+    if isinstance(source, int):
+        cap = openDevice(source)
+        if cap.isOpened():
+            fourcc, width, height, fps, bufferSize = negotiateFormat(cap, width, height, fps)
+            logger.info("Camera %s opened in %.0f ms : %s %dx%d at %.0f FPS, %d driver buffers", source,
+                        (time.monotonic() - startTime) * 1000.0, fourcc or "?", width, height, fps, bufferSize)
+            return CameraCapture(cap, source, metrics)
+
+        cap.release()
+        logger.warning("Camera %s could not be opened", source)
+        if fallbackFile is None:
+            return CameraCapture(cap, source, metrics)
+        source = fallbackFile
+
+    cap = cv2.VideoCapture(source)
+    if cap.isOpened():
+        logger.info("Video %s opened in %.0f ms, played at %.0f FPS as a camera", source,
+                    (time.monotonic() - startTime) * 1000.0, cap.get(cv2.CAP_PROP_FPS))
+    else:
+        logger.warning("Video %s could not be opened", source)
+    return CameraCapture(cap, source, metrics)
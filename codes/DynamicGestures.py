@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Dynamic gestures from the movement of the controlling hand over recent frames.
+
+LandmarkWindow keeps, in a ring buffer of the last windowFrames frames, the
+palm center, the running path length and the unwrapped hand angle of every
+frame, the last two as prefix sums, so displacement, velocity,
+straightness and rotation over the window are differences between the newest
+and the oldest slot : the cost per frame does not depend on the window length.
+
+DynamicGestureDetector turns these features into horizontal swipes (seek) and
+wrist rotation (volume) :
+
+* swipe : the palm moved along x by swipeDistance image widths, mostly
+  straight and within swipeSeconds. One event, then the window starts over.
+* rotate : the open, upright hand turned by rotateDegrees within the window
+  while the palm stayed in place. The first rotateDegrees are a dead zone, so
+  turning the hand into a sideways pose is not a rotation; once engaged, every
+  frame reports the degrees turned since the previous one, clockwise on screen
+  is positive.
+
+The window starts over when the controlling hand changes, positions of two
+different hands are not a movement.
+"""
+
+import math
+import numpy as np
+
+# Constants
+DEFAULT_WINDOW_FRAMES   = 8
+DEFAULT_SWIPE_DISTANCE  = 0.25      # image widths
+DEFAULT_SWIPE_SECONDS   = 0.6
+DEFAULT_ROTATE_DEGREES  = 20.0
+SWIPE_STRAIGHTNESS      = 0.8       # x displacement over path length
+SWIPE_SLOPE             = 0.5       # largest |dy| / |dx|
+SWIPE_COOLDOWN          = 0.5       # seconds, so bringing the hand back is not a swipe
+ROTATE_MAX_SHIFT        = 0.1       # image widths the palm may move while rotating
+ROTATE_STOP_DEGREES     = 5.0
+PALM_LANDMARKS          = [0, 5, 9, 13, 17]     # wrist and finger MCPs
+WRIST                   = 0
+MIDDLE_FINGER_MCP       = 9
+
+DYNAMIC_SWIPE_LEFT      = "swipeLeft"
+DYNAMIC_SWIPE_RIGHT     = "swipeRight"
+DYNAMIC_ROTATE          = "rotate"
+
+
+class DynamicGesture():
+
+    def __init__(self, name, timestamp, value):
+        self.name      = name
+        self.timestamp = timestamp
+        # x velocity in image widths per second for swipes, degrees for rotate
+        self.value     = value
+
+    def __repr__(self):
+        return "DynamicGesture(%s, %.3f)" % (self.name, self.value)
+
+
+class LandmarkWindow():
+
+    def __init__(self, windowFrames=DEFAULT_WINDOW_FRAMES):
+        if windowFrames < 2:
+            raise ValueError("windowFrames must be at least 2, got %d" % windowFrames)
+        self.windowFrames = windowFrames
+        self.times        = np.zeros(windowFrames)
+        self.centers      = np.zeros((windowFrames, 2))
+        self.paths        = np.zeros(windowFrames)       # path length of the palm center since the first frame
+        self.angles       = np.zeros(windowFrames)       # unwrapped hand angle in degrees
+        self.clear()
+
+    def clear(self):
+        self.count  = 0
+        self.newest = -1
+
+    def isFull(self):
+        return self.count == self.windowFrames
+
+    def push(self, landmarks, imageWidth, timestamp):
+        # landmarks of one hand in pixels, positions are kept in image widths
+        previous    = self.newest
+        self.newest = (self.newest + 1) % self.windowFrames
+        self.count  = min(self.count + 1, self.windowFrames)
+
+        slot = self.newest
+        self.times[slot]     = timestamp
+        center = landmarks[PALM_LANDMARKS, :2].mean(axis=0) / imageWidth
+        dx, dy = landmarks[MIDDLE_FINGER_MCP, :2] - landmarks[WRIST, :2]
+        angle  = math.degrees(math.atan2(dy, dx))
+
+        if self.count == 1:
+            self.paths[slot]  = 0.0
+            self.angles[slot] = angle
+        else:
+            step  = center - self.centers[previous]
+            # shortest turn from the previous frame, so crossing +-180 degrees is not a full turn
+            turn  = (angle - self.angles[previous] + 180.0) % 360.0 - 180.0
+            self.paths[slot]  = self.paths[previous] + math.hypot(step[0], step[1])
+            self.angles[slot] = self.angles[previous] + turn
+        self.centers[slot] = center
+
+    def oldest(self):
+        return (self.newest - self.count + 1) % self.windowFrames
+
+    def previous(self):
+        return (self.newest - 1) % self.windowFrames
+
+    # Features over the window, newest minus oldest frame
+
+    def duration(self):
+        return self.times[self.newest] - self.times[self.oldest()]
+
+    def displacement(self):
+        return self.centers[self.newest] - self.centers[self.oldest()]
+
+    def velocity(self):
+        duration = self.duration()
+        return self.displacement() / duration if duration > 0 else np.zeros(2)
+
+    def pathLength(self):
+        return self.paths[self.newest] - self.paths[self.oldest()]
+
+    def rotation(self, frames=None):
+        # over the whole window, or over its last frames only
+        count = self.count if frames is None else min(frames, self.count)
+        if count < 2:
+            return 0.0
+        return self.angles[self.newest] - self.angles[(self.newest - count + 1) % self.windowFrames]
+
+    def lastTurn(self):
+        return self.angles[self.newest] - self.angles[self.previous()] if self.count > 1 else 0.0
+
+
+class DynamicGestureDetector():
+
+    def __init__(self, windowFrames=DEFAULT_WINDOW_FRAMES, swipeDistance=DEFAULT_SWIPE_DISTANCE,
+                 swipeSeconds=DEFAULT_SWIPE_SECONDS, rotateDegrees=DEFAULT_ROTATE_DEGREES):
+        self.window        = LandmarkWindow(windowFrames)
+        self.swipeDistance = swipeDistance
+        self.swipeSeconds  = swipeSeconds
+        self.rotateDegrees = rotateDegrees
+        self.rotating      = False
+        self.rotateFrames  = 0
+        self.hand          = None
+        self.cooldownUntil = 0.0
+
+    def update(self, landmarks, imageWidth, timestamp, hand=None, canRotate=True):
+        # landmarks of the controlling hand (None without a hand) -> list of DynamicGesture
+        # hand identifies the controlling hand, e.g. (index, direction); canRotate is False unless it is open and upright
+        if landmarks is None or hand != self.hand:
+            self.reset()
+            self.hand = hand
+            if landmarks is None:
+                return []
+
+        window = self.window
+        window.push(landmarks, imageWidth, timestamp)
+        self.rotateFrames = self.rotateFrames + 1 if canRotate else 0
+        if window.count < 2:
+            return []
+
+        if self.rotating:
+            if not canRotate or abs(window.rotation()) < ROTATE_STOP_DEGREES:
+                self.rotating = False
+                return []
+            return [DynamicGesture(DYNAMIC_ROTATE, timestamp, window.lastTurn())]
+
+        dx, dy = window.displacement()
+        if (timestamp >= self.cooldownUntil and abs(dx) >= self.swipeDistance and abs(dy) <= SWIPE_SLOPE * abs(dx)
+                and window.duration() <= self.swipeSeconds
+                and abs(dx) >= SWIPE_STRAIGHTNESS * window.pathLength()):
+            velocity = window.velocity()[0]
+            window.clear()
+            self.cooldownUntil = timestamp + SWIPE_COOLDOWN
+            return [DynamicGesture(DYNAMIC_SWIPE_RIGHT if dx > 0 else DYNAMIC_SWIPE_LEFT, timestamp, velocity)]
+
+        # only the turn made since the hand became open and upright counts
+        rotation = window.rotation(self.rotateFrames)
+        if abs(rotation) >= self.rotateDegrees and math.hypot(dx, dy) <= ROTATE_MAX_SHIFT:
+            # what goes beyond the dead zone is reported at once
+            self.rotating = True
+            return [DynamicGesture(DYNAMIC_ROTATE, timestamp, rotation - math.copysign(self.rotateDegrees, rotation))]
+        return []
+
+    def reset(self):
+        self.window.clear()
+        self.rotating     = False
+        self.rotateFrames = 0
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Reusable frame buffers for the camera -> inference -> QLabel path.
+
+FramePool hands out full frames which travel through the pipeline stages and
+come back once the frame is displayed or dropped. ScratchBuffer gives
+contiguous views of varying shape (ROI crops, downscaled search frames) over
+one growing backing array. Both count their allocations, and AllocationProbe
+measures the transient NumPy/Python heap per frame with tracemalloc.
+"""
+
+import math
+import threading
+import tracemalloc
+import numpy as np
+
+# Constants
+FRAME_POOL_SIZE = 8
+
+
+class FramePool():
+
+    def __init__(self, dtype=np.uint8, maxFree=FRAME_POOL_SIZE):
+        self.dtype       = dtype
+        self.maxFree     = maxFree
+        self.shape       = None
+        self.free        = []
+        self.lock        = threading.Lock()
+        self.allocations = 0
+
+    def acquire(self, shape):
+        with self.lock:
+            if shape != self.shape:
+                # camera resolution changed, the old buffers are useless
+                self.shape = shape
+                self.free.clear()
+            if self.free:
+                return self.free.pop()
+            self.allocations += 1
+
+        return np.empty(shape, dtype=self.dtype)
+
+    def release(self, buffer):
+        with self.lock:
+            if buffer.shape == self.shape and len(self.free) < self.maxFree:
+                self.free.append(buffer)
+
+
+class ScratchBuffer():
+
+    def __init__(self, dtype=np.uint8):
+        self.dtype       = dtype
+        self.backing     = np.empty(0, dtype=dtype)
+        self.allocations = 0
+
+    def view(self, shape):
+        size = math.prod(shape)
+        if size > self.backing.size:
+            self.backing = np.empty(size, dtype=self.dtype)
+            self.allocations += 1
+        return self.backing[:size].reshape(shape)
+
+
+class AllocationProbe():
+
+    def __init__(self):
+        self.frames         = 0
+        self.transientBytes = 0
+        self.frameStartSize = 0
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def frameStart(self):
+        tracemalloc.reset_peak()
+        self.frameStartSize = tracemalloc.get_traced_memory()[0]
+
+    def frameEnd(self):
+        # peak heap growth inside the frame, i.e. the temporaries it allocated
+        current, peak = tracemalloc.get_traced_memory()
+        self.transientBytes += peak - self.frameStartSize
+        self.frames += 1
+
+    def bytesPerFrame(self):
+        if self.frames == 0:
+            return 0.0
+        return self.transientBytes / self.frames
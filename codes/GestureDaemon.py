@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+Headless gesture daemon : publishes gesture events on a Unix domain socket.
+
+A detection thread reads the camera, runs HandDetector and turns the gestures
+of the controlling hand into start, hold and end events (GestureEventEngine)
+and swipe or rotate events (DynamicGestureDetector). An asyncio server hands
+the events to every connected subscriber, so external players and kiosks can
+react to gestures without the Qt player. Nothing here imports Qt.
+
+Every message is a 4 byte big endian length followed by that many bytes of
+UTF-8 JSON, e.g.
+
+    {"type": "start", "gesture": "ThumbUp", "action": "volumeUp", "frameId": 812,
+     "captureTime": 5231.204, "duration": 0.0, "elapsed": 0.0, "encodedTime": 5231.229}
+
+Gestures bound to a continuous action (volume up and down) also get hold
+events while they are held, at most every --hold-interval seconds, whose
+elapsed is the time since the previous message of the gesture. captureTime
+and encodedTime (when the message was built, before it is queued) are
+time.monotonic() seconds of the daemon host.
+Messages waiting for a subscriber are written in one batch; every subscriber
+has its own bounded queue which drops the oldest messages when the subscriber
+does not keep up, so a slow client never holds up the camera or the others.
+The time from frame capture to delivery is logged every few seconds and can
+be exported with --metrics-file.
+A frame whose capture or detection fails is skipped; after MAX_FRAME_ERRORS
+failed frames in a row the server is closed, so subscribers see the daemon go
+away instead of a socket which stays silent.
+
+Usage : python GestureDaemon.py --socket /tmp/gestures.sock [--camera 0] [--gestures gestures.json]
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import struct
+import asyncio
+import logging
+import argparse
+import threading
+import collections
+from CameraCapture import openCamera
+from HandDetector import HandDetector, loadGestureRules
+from HandPolicies import HAND_POLICIES, HAND_POLICY_LARGEST
+from GestureEvents import GestureEventEngine, EVENT_HOLD
+from GestureRules import ACTION_VOLUME_UP, ACTION_VOLUME_DOWN
+from DynamicGestures import DynamicGestureDetector
+from MotionGate import MotionGate
+from QualityController import QualityController
+from StageMetrics import StageMetrics, MetricsExporter
+
+# Constants
+DEFAULT_SOCKET_PATH     = "/tmp/gesture_events.sock"
+DEFAULT_QUEUE_SIZE      = 256       # messages per subscriber
+DEFAULT_HOLD_INTERVAL   = 0.1       # seconds between hold messages
+CONTINUOUS_ACTIONS      = {ACTION_VOLUME_UP, ACTION_VOLUME_DOWN}
+DEFAULT_DETECTION_CON   = 0.7
+CAP_FRAME_WIDTH         = 400
+CAP_FRAME_HEIGHT        = 400
+SEARCH_FRAME_SIZE       = 320
+TARGET_FPS              = 30
+P95_LATENCY_BUDGET      = 40        # ms
+REPORT_INTERVAL         = 10.0      # seconds
+CAPTURE_RETRY_DELAY     = 0.01
+MAX_FRAME_ERRORS        = 30        # consecutive failed frames before the daemon shuts down
+LENGTH_PREFIX           = struct.Struct(">I")
+
+logger = logging.getLogger(__name__)
+
+
+def encodeMessage(message):
+    data = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    return LENGTH_PREFIX.pack(len(data)) + data
+
+
+class Subscriber():
+
+    def __init__(self, writer, queueSize=DEFAULT_QUEUE_SIZE):
+        self.writer    = writer
+        self.queue     = collections.deque(maxlen=queueSize)
+        self.ready     = asyncio.Event()
+        self.dropped   = 0
+        self.delivered = 0
+
+    def push(self, message):
+        # (encoded message, capture time), the oldest one goes when the queue is full
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(message)
+        self.ready.set()
+
+
+class EventServer():
+
+    def __init__(self, socketPath, metrics=None, queueSize=DEFAULT_QUEUE_SIZE):
+        self.socketPath  = socketPath
+        self.metrics     = metrics
+        self.queueSize   = queueSize
+        self.subscribers = set()
+        self.loop        = None
+        self.server      = None
+
+    async def start(self):
+        # a socket file left behind by a crashed daemon is replaced
+        if os.path.exists(self.socketPath):
+            os.unlink(self.socketPath)
+        self.loop   = asyncio.get_running_loop()
+        self.server = await asyncio.start_unix_server(self.handleClient, path=self.socketPath)
+        logger.info("Publishing gesture events on %s", self.socketPath)
+
+    async def close(self):
+        self.server.close()
+        for subscriber in list(self.subscribers):
+            subscriber.writer.close()
+        await self.server.wait_closed()
+        if os.path.exists(self.socketPath):
+            os.unlink(self.socketPath)
+
+    def publish(self, messages):
+        # called from the detection thread, the messages are encoded once for every subscriber
+        self.loop.call_soon_threadsafe(self.broadcast, messages)
+
+    def broadcast(self, messages):
+        for subscriber in self.subscribers:
+            for message in messages:
+                subscriber.push(message)
+
+    async def handleClient(self, reader, writer):
+        subscriber = Subscriber(writer, self.queueSize)
+        self.subscribers.add(subscriber)
+        logger.info("Subscriber connected, %d subscribers", len(self.subscribers))
+
+        # subscribers only listen, anything they send is ignored until they disconnect
+        sender = asyncio.ensure_future(self.sendMessages(subscriber))
+        try:
+            while await reader.read(4096):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            sender.cancel()
+            self.subscribers.discard(subscriber)
+            writer.close()
+            logger.info("Subscriber disconnected after %d messages, %d dropped, %d subscribers",
+                        subscriber.delivered, subscriber.dropped, len(self.subscribers))
+
+    async def sendMessages(self, subscriber):
+        try:
+            while True:
+                await subscriber.ready.wait()
+                subscriber.ready.clear()
+                batch = list(subscriber.queue)
+                subscriber.queue.clear()
+
+                subscriber.writer.write(b"".join(data for data, captureTime in batch))
+                await subscriber.writer.drain()
+                subscriber.delivered += len(batch)
+                if self.metrics is not None:
+                    deliveryTime = time.monotonic()
+                    for data, captureTime in batch:
+                        self.metrics.record("delivery", deliveryTime - captureTime)
+        except ConnectionError:
+            subscriber.writer.close()
+
+    def droppedMessages(self):
+        return sum(subscriber.dropped for subscriber in self.subscribers)
+
+
+class GestureDaemon(threading.Thread):
+
+    def __init__(self, cap, handDetector, server, metrics=None, holdInterval=DEFAULT_HOLD_INTERVAL):
+        super().__init__(name="GestureDaemon", daemon=True)
+        self.cap               = cap
+        self.handDetector      = handDetector
+        self.server            = server
+        self.metrics           = metrics
+        self.stopEvent         = threading.Event()
+        self.gestureEvents     = GestureEventEngine()
+        self.dynamicGestures   = DynamicGestureDetector()
+        self.qualityController = QualityController(TARGET_FPS, P95_LATENCY_BUDGET)
+        self.gestures          = handDetector.gestureRules.gestures
+        self.actions           = handDetector.gestureRules.actions
+        self.frameId           = 0
+        # hold time not sent yet, so throttled hold messages still add up to the time held
+        self.holdInterval      = holdInterval
+        self.pendingHold       = 0.0
+        self.image             = None
+        # called without arguments from this thread when it gives up, the server is shut down then
+        self.onFailure         = None
+        self.failed            = False
+        self.errors            = 0
+
+    def stop(self):
+        self.stopEvent.set()
+
+    def run(self):
+        # a failing frame (cv2 or MediaPipe error) is skipped, the next one may be fine
+        while not self.stopEvent.is_set():
+            try:
+                self.step()
+                self.errors = 0
+            except Exception:
+                self.errors += 1
+                logger.exception("Gesture detection failed")
+                if self.errors >= MAX_FRAME_ERRORS:
+                    logger.error("Gesture detection failed %d times in a row, shutting down", self.errors)
+                    self.failed = True
+                    self.stopEvent.set()
+                    if self.onFailure is not None:
+                        self.onFailure()
+
+    def step(self):
+        # cap is a CameraCapture : the newest frame and the moment it was grabbed,
+        # mirrored like the player so left and right mean the same for both
+        success, image = self.cap.read(image=self.image, flipCode=1)
+        self.image = image
+        if not success:
+            time.sleep(CAPTURE_RETRY_DELAY)
+            return
+
+        captureTime = self.cap.captureTime
+        self.frameId += 1
+        startTime = time.perf_counter()
+
+        self.qualityController.apply(self.handDetector)
+        self.handDetector.detectHands(image, draw=False)
+        if not self.handDetector.inferenceSkipped:
+            self.qualityController.record((time.perf_counter() - startTime) * 1000.0)
+        # the detector records the model call itself as "inference"
+        startTime = self.recordStage("detect", startTime)
+
+        messages = self.gestureMessages(captureTime, image.shape[1])
+        if messages:
+            self.server.publish(messages)
+        self.recordStage("events", startTime)
+
+    def gestureMessages(self, captureTime, imageWidth):
+        handDetector = self.handDetector
+        messages     = []
+        gestureId    = handDetector.getGestureId()
+        for event in self.gestureEvents.update(gestureId, captureTime):
+            # one shot actions, no hand and ignore only need their start and end
+            elapsed = event.elapsed
+            if event.eventType == EVENT_HOLD:
+                if self.actions[event.gestureId] not in CONTINUOUS_ACTIONS:
+                    continue
+                self.pendingHold += elapsed
+                if round(self.pendingHold, 4) < self.holdInterval:
+                    continue
+                elapsed = self.pendingHold
+            self.pendingHold = 0.0
+            messages.append(self.message(event.eventType, captureTime, gesture=self.gestures[event.gestureId],
+                                         action=self.actions[event.gestureId], duration=round(event.duration, 4),
+                                         elapsed=round(elapsed, 4)))
+
+        # the window starts over when another hand takes control, rotation only follows the open hand
+        controlIndex = handDetector.controlIndex
+        landmarks = handDetector.handLandmarks[controlIndex] if controlIndex >= 0 else None
+        hand      = (controlIndex, handDetector.handDirections[controlIndex]) if controlIndex >= 0 else None
+        canRotate = gestureId == handDetector.gestureRules.openHandId
+        for gesture in self.dynamicGestures.update(landmarks, imageWidth, captureTime, hand, canRotate):
+            messages.append(self.message(gesture.name, captureTime, value=round(float(gesture.value), 4)))
+        return messages
+
+    def message(self, messageType, captureTime, **fields):
+        message = {"type": messageType, "frameId": self.frameId, "captureTime": captureTime}
+        message.update(fields)
+        message["encodedTime"] = time.monotonic()
+        return encodeMessage(message), captureTime
+
+    def recordStage(self, stage, startTime):
+        endTime = time.perf_counter()
+        if self.metrics is not None:
+            self.metrics.record(stage, endTime - startTime)
+        return endTime
+
+
+async def reportLatency(server, metrics, interval=REPORT_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        delivery = metrics.snapshot().get("delivery")
+        if delivery is not None:
+            logger.info("Capture to delivery p50 %.1f ms, p95 %.1f ms, %d subscribers, %d messages dropped",
+                        delivery["p50"] * 1000.0, delivery["p95"] * 1000.0, len(server.subscribers),
+                        server.droppedMessages())
+
+
+async def serve(args):
+    metrics = StageMetrics()
+    gestureRules = loadGestureRules(args.gestures) if args.gestures else None
+    handDetector = HandDetector(detectionCon=DEFAULT_DETECTION_CON, motionGate=MotionGate(), roiTracking=True,
+                                searchSize=SEARCH_FRAME_SIZE, metrics=metrics, handPolicy=args.hand_policy,
+                                gestureRules=gestureRules)
+
+    cap = openCamera(args.camera, CAP_FRAME_WIDTH, CAP_FRAME_HEIGHT, TARGET_FPS, metrics, args.fallback_video)
+    if not cap.isOpened():
+        handDetector.hands.close()
+        return 1
+
+    server = EventServer(args.socket, metrics, args.queue_size)
+    await server.start()
+    exporter = None
+    if args.metrics_file:
+        exporter = MetricsExporter(metrics, args.metrics_file)
+        exporter.start()
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    daemon = GestureDaemon(cap, handDetector, server, metrics, args.hold_interval)
+    # subscribers see the socket close instead of a daemon which publishes nothing
+    daemon.onFailure = lambda: loop.call_soon_threadsafe(stopped.set)
+    daemon.start()
+    reporter = asyncio.ensure_future(reportLatency(server, metrics))
+
+    for signalNumber in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signalNumber, stopped.set)
+    await stopped.wait()
+
+    logger.info("Stopping")
+    reporter.cancel()
+    daemon.stop()
+    daemon.join()
+    await server.close()
+    if exporter is not None:
+        exporter.stop()
+        exporter.join()
+    cap.release()
+    handDetector.hands.close()
+    return 1 if daemon.failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publish gesture events on a Unix domain socket, without the player.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="path of the Unix domain socket")
+    parser.add_argument("--camera", default="0", help="camera device index or video file")
+    parser.add_argument("--fallback-video", help="video file played instead of the camera when it cannot be opened")
+    parser.add_argument("--gestures", help="JSON file with additional gesture rules")
+    parser.add_argument("--hand-policy", default=HAND_POLICY_LARGEST, choices=HAND_POLICIES)
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="messages kept for a slow subscriber before the oldest are dropped")
+    parser.add_argument("--hold-interval", type=float, default=DEFAULT_HOLD_INTERVAL,
+                        help="seconds between the hold messages of volume gestures, 0 for every frame")
+    parser.add_argument("--metrics-file", help="export stage timings, Prometheus text for .prom files and CSV otherwise")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    return asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Temporal gesture events between the classifier and the player.
+
+A gesture becomes active once it wins agreeFrames of the last windowFrames
+classified frames, and stays active while it keeps that majority. The engine
+turns the per frame gesture ids into START, HOLD and END events; HOLD carries
+the time since the previous frame so continuous actions can run at a fixed
+rate per second, whatever the camera and inference speed.
+"""
+
+import collections
+
+# Constants
+DEFAULT_AGREE_FRAMES   = 3
+DEFAULT_WINDOW_FRAMES  = 5
+EVENT_START            = "start"
+EVENT_HOLD             = "hold"
+EVENT_END              = "end"
+
+
+class GestureEvent():
+
+    def __init__(self, eventType, gestureId, timestamp, duration=0.0, elapsed=0.0):
+        self.eventType = eventType
+        self.gestureId = gestureId
+        self.timestamp = timestamp
+        # seconds since the gesture started, and since the previous frame for HOLD
+        self.duration  = duration
+        self.elapsed   = elapsed
+
+    def __repr__(self):
+        return "GestureEvent(%s, %d, duration=%.3f, elapsed=%.3f)" % (
+            self.eventType, self.gestureId, self.duration, self.elapsed)
+
+
+class GestureEventEngine():
+
+    def __init__(self, agreeFrames=DEFAULT_AGREE_FRAMES, windowFrames=DEFAULT_WINDOW_FRAMES):
+        # a strict majority, so at most one gesture can be active
+        if not windowFrames / 2.0 < agreeFrames <= windowFrames:
+            raise ValueError("agreeFrames must be more than half of windowFrames, got %d of %d"
+                             % (agreeFrames, windowFrames))
+        self.agreeFrames = agreeFrames
+        self.window      = collections.deque(maxlen=windowFrames)
+        self.votes       = collections.Counter()
+        self.activeId    = None
+        self.startTime   = 0.0
+        self.lastTime    = None
+
+    def update(self, gestureId, timestamp):
+        # gesture id of one classified frame and its capture time in seconds -> list of events
+        if len(self.window) == self.window.maxlen:
+            self.votes[self.window[0]] -= 1
+        self.window.append(gestureId)
+        self.votes[gestureId] += 1
+
+        events = []
+        if self.activeId is not None and self.votes[self.activeId] < self.agreeFrames:
+            events.append(GestureEvent(EVENT_END, self.activeId, timestamp, timestamp - self.startTime))
+            self.activeId = None
+
+        if self.activeId is None:
+            if self.votes[gestureId] >= self.agreeFrames:
+                self.activeId  = gestureId
+                self.startTime = timestamp
+                events.append(GestureEvent(EVENT_START, gestureId, timestamp))
+        else:
+            events.append(GestureEvent(EVENT_HOLD, self.activeId, timestamp, timestamp - self.startTime,
+                                       timestamp - self.lastTime))
+
+        self.lastTime = timestamp
+        return events
+
+    def reset(self):
+        # forget the window, e.g. when the camera restarts; the active gesture gets no END event
+        self.window.clear()
+        self.votes.clear()
+        self.activeId = None
+        self.lastTime = None
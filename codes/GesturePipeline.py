@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Staged gesture pipeline : capture thread -> inference worker -> classifier -> GUI.
+
+Stages are connected by bounded queues which drop the oldest frame when the
+consumer is busy, so a slow stage never makes the others fall behind. The last
+stage keeps only the newest result and notifies the GUI thread with a Qt signal.
+An error in a stage is logged and the frame dropped; a stage which keeps
+failing stops the pipeline and reports it to the GUI with the failed signal.
+"""
+
+import time
+import queue
+import logging
+import threading
+from PyQt5 import QtCore
+from HandDetector import HandClassifier
+from FrameBuffers import FramePool
+
+# Constants
+STAGE_QUEUE_SIZE    = 1
+STAGE_POLL_TIMEOUT  = 0.1
+CAPTURE_RETRY_DELAY = 0.01
+STAGE_MAX_ERRORS    = 30      # consecutive failures before a stage gives up
+
+logger = logging.getLogger(__name__)
+
+
+class LatestQueue():
+
+    def __init__(self, maxsize=STAGE_QUEUE_SIZE):
+        self.queue   = queue.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, item):
+        # never block the producer; throw the stale item away instead
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait().release()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=STAGE_POLL_TIMEOUT):
+        return self.queue.get(timeout=timeout)
+
+
+class FramePacket():
+
+    def __init__(self, frameId, image, captureTime, framePool=None):
+        self.frameId        = frameId
+        self.image          = image
+        self.captureTime    = captureTime
+        self.framePool      = framePool
+        self.landmarks      = None
+        self.handDirection  = HandClassifier.HAND_DIRECTION_NONE
+        self.bbox           = []
+        self.handPosition   = HandClassifier.HAND_POSITION_NO_HAND
+        self.gestureId      = None
+        # every detected hand, the fields above belong to handLandmarks[controlIndex]
+        self.handLandmarks  = None
+        self.rawLandmarks   = None
+        self.region         = None
+        self.handDirections = []
+        self.handBoxes      = []
+        self.handPositions  = []
+        self.controlIndex   = -1
+        self.sourceIndex    = 0
+
+    def release(self):
+        # give the image buffer back to the pool once the frame is displayed or dropped
+        if self.framePool is not None:
+            self.framePool.release(self.image)
+            self.framePool = None
+
+
+class PipelineStage(threading.Thread):
+
+    def __init__(self, name, inputQueue, outputQueue, stopEvent):
+        super().__init__(name=name, daemon=True)
+        self.inputQueue  = inputQueue
+        self.outputQueue = outputQueue
+        self.stopEvent   = stopEvent
+        # called with a message when the stage gives up, from the stage thread
+        self.onError     = None
+        self.errors      = 0
+
+    def run(self):
+        # a failing frame (cv2 or MediaPipe error, unexpected frame shape) is dropped, the next one may be fine
+        while not self.stopEvent.is_set():
+            try:
+                self.step()
+                self.errors = 0
+            except Exception as e:
+                self.errors += 1
+                logger.exception("%s failed", self.name)
+                if self.errors >= STAGE_MAX_ERRORS:
+                    logger.error("%s failed %d times in a row, stopping the pipeline", self.name, self.errors)
+                    self.stopEvent.set()
+                    if self.onError is not None:
+                        self.onError("%s stopped : %s" % (self.name, e))
+
+    def step(self):
+        try:
+            packet = self.inputQueue.get()
+        except queue.Empty:
+            return
+
+        try:
+            result = self.process(packet)
+        except Exception:
+            packet.release()
+            raise
+        if result is not None:
+            self.outputQueue.put(result)
+        else:
+            packet.release()
+
+    def process(self, packet):
+        return packet
+
+
+class CaptureStage(PipelineStage):
+
+    def __init__(self, cap, outputQueue, stopEvent, framePool, metrics=None):
+        super().__init__("CaptureStage", None, outputQueue, stopEvent)
+        self.cap       = cap
+        self.frameId   = 0
+        self.framePool = framePool
+        self.frameShape = None
+        self.metrics   = metrics
+
+    def step(self):
+        # cap is a CameraCapture : it mirrors the newest frame straight into a pooled buffer
+        # and records the wait for the frame and the copy itself
+        buffer = self.framePool.acquire(self.frameShape) if self.frameShape is not None else None
+        success, image = self.cap.read(image=buffer, flipCode=1)
+        if not success:
+            if buffer is not None:
+                self.framePool.release(buffer)
+            time.sleep(CAPTURE_RETRY_DELAY)
+            return
+
+        # a new camera resolution comes in a fresh array, the pool follows on the next acquire
+        self.frameShape = image.shape
+        self.frameId   += 1
+        self.outputQueue.put(FramePacket(self.frameId, image, self.cap.captureTime, self.framePool))
+
+
+class InferenceStage(PipelineStage):
+
+    def __init__(self, handDetector, inputQueue, outputQueue, stopEvent, qualityController=None):
+        super().__init__("InferenceStage", inputQueue, outputQueue, stopEvent)
+        self.handDetector      = handDetector
+        self.qualityController = qualityController
+
+    def process(self, packet):
+        if self.qualityController is not None:
+            self.qualityController.apply(self.handDetector)
+
+        startTime    = time.perf_counter()
+        packet.image = self.handDetector.detectHands(packet.image, draw=False)
+        if self.qualityController is not None and not self.handDetector.inferenceSkipped:
+            self.qualityController.record((time.perf_counter() - startTime) * 1000.0)
+
+        # the detector reuses its landmark array, so the packet keeps its own copy
+        packet.landmarks      = self.handDetector.landmarks.copy()
+        packet.handDirection  = self.handDetector.handDirection
+        packet.bbox           = self.handDetector.bbox
+        packet.handLandmarks  = self.handDetector.handLandmarks.copy()
+        packet.rawLandmarks   = self.handDetector.rawLandmarks.copy()
+        packet.region         = self.handDetector.region
+        packet.handDirections = self.handDetector.handDirections
+        packet.handBoxes      = self.handDetector.handBoxes
+        packet.controlIndex   = self.handDetector.controlIndex
+        return packet
+
+
+class ClassifierStage(PipelineStage):
+
+    def __init__(self, inputQueue, outputQueue, stopEvent, metrics=None, gestureRules=None, recorder=None):
+        super().__init__("ClassifierStage", inputQueue, outputQueue, stopEvent)
+        self.handClassifier = HandClassifier(gestureRules)
+        self.metrics        = metrics
+        self.recorder       = recorder
+
+    def process(self, packet):
+        # gesture ids index the rule table of the detector, e.g. its action list
+        startTime  = time.perf_counter()
+        gestures   = self.handClassifier.gestureRules.gestures
+        gestureIds = self.handClassifier.classifyHandIds(packet.handLandmarks, packet.handDirections).tolist()
+        packet.handPositions = [gestures[gestureId] for gestureId in gestureIds]
+        packet.gestureId     = gestureIds[packet.controlIndex] if gestureIds else self.handClassifier.gestureRules.noHandId
+        packet.handPosition  = gestures[packet.gestureId]
+        if self.metrics is not None:
+            startTime = self.recordStage("classify", startTime)
+
+        if self.recorder is not None:
+            self.recorder.write(packet.frameId, packet.captureTime, packet.image.shape, packet.region,
+                                packet.rawLandmarks, packet.handDirections, gestureIds, packet.controlIndex)
+            if self.metrics is not None:
+                self.recordStage("record", startTime)
+        return packet
+
+    def recordStage(self, stage, startTime):
+        endTime = time.perf_counter()
+        self.metrics.record(stage, endTime - startTime)
+        return endTime
+
+
+class ResultSlot():
+
+    def __init__(self, notify):
+        self.notify  = notify
+        self.lock    = threading.Lock()
+        self.packet  = None
+        self.dropped = 0
+
+    def put(self, packet):
+        # only one notification is in flight; newer results replace unread ones
+        with self.lock:
+            pending = self.packet is not None
+            if pending:
+                self.packet.release()
+                self.dropped += 1
+            self.packet = packet
+
+        if not pending:
+            self.notify()
+
+    def take(self):
+        with self.lock:
+            packet, self.packet = self.packet, None
+            return packet
+
+
+class GesturePipeline(QtCore.QObject):
+
+    resultReady = QtCore.pyqtSignal()
+    failed      = QtCore.pyqtSignal(str)
+
+    def __init__(self, cap, handDetector, parent=None, qualityController=None, metrics=None, recorder=None):
+        super().__init__(parent)
+        self.stopEvent       = threading.Event()
+        self.captureQueue    = LatestQueue()
+        self.classifierQueue = LatestQueue()
+        self.resultSlot      = ResultSlot(self.resultReady.emit)
+        self.framePool       = FramePool()
+
+        self.stages = [
+            CaptureStage(cap, self.captureQueue, self.stopEvent, self.framePool, metrics),
+            InferenceStage(handDetector, self.captureQueue, self.classifierQueue, self.stopEvent, qualityController),
+            ClassifierStage(self.classifierQueue, self.resultSlot, self.stopEvent, metrics, handDetector.gestureRules,
+                            recorder),
+        ]
+        for stage in self.stages:
+            stage.onError = self.failed.emit
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self, timeout=1.0):
+        self.stopEvent.set()
+        for stage in self.stages:
+            if stage.is_alive():
+                stage.join(timeout)
+
+    def takeResult(self):
+        # called from the GUI thread when resultReady is received, release the packet after painting it
+        return self.resultSlot.take()
+
+    def droppedFrames(self):
+        return self.captureQueue.dropped + self.classifierQueue.dropped + self.resultSlot.dropped
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Declarative gesture rules, compiled into an integer lookup table.
+
+A rule gives a gesture name, a finger pattern, a hand orientation and the
+action the player runs for it. Finger patterns are written thumb to pinky with
+1 (up), 0 (down) or x (either), e.g. "01100" for the victory sign. Rules are
+compiled into table[orientation, fingersUpMask] -> gesture id, the first
+matching rule wins, and every cell must be covered. Extra rules can be loaded
+from a JSON file :
+
+    {"gestures": [{"name": "Rock", "fingers": "01001", "orientation": "upright", "action": "stop"}]}
+
+Rules of the file replace the built in rules of the same name, so a built in
+gesture can be bound to another action or given another finger pattern.
+"""
+
+import json
+import numpy as np
+
+# Constants
+NUM_FINGERS               = 5
+FINGER_MASK_COUNT         = 1 << NUM_FINGERS
+FINGER_PATTERN_UP         = "1"
+FINGER_PATTERN_DOWN       = "0"
+FINGER_PATTERN_ANY        = "x"
+
+# Hand orientations, rows of the compiled table
+ORIENTATION_UPRIGHT       = 0       # fingers point up
+ORIENTATION_THUMB_UP      = 1       # hand sideways, fingers towards the thumb side, thumb up
+ORIENTATION_THUMB_DOWN    = 2       # same with the thumb down
+ORIENTATION_NO_HAND       = 3       # nothing detected
+ORIENTATION_NAMES         = {"upright": ORIENTATION_UPRIGHT, "thumbUp": ORIENTATION_THUMB_UP,
+                             "thumbDown": ORIENTATION_THUMB_DOWN, "noHand": ORIENTATION_NO_HAND}
+ORIENTATION_ANY           = "any"   # every orientation with a hand
+ORIENTATION_COUNT         = len(ORIENTATION_NAMES)
+
+# Player actions
+ACTION_PLAY               = "play"
+ACTION_STOP               = "stop"
+ACTION_VOLUME_UP          = "volumeUp"
+ACTION_VOLUME_DOWN        = "volumeDown"
+ACTION_VOLUME_MUTE        = "volumeMute"
+ACTION_NEXT               = "next"
+ACTION_PREVIOUS           = "previous"
+ACTION_IGNORE             = "ignore"
+ACTION_NO_HAND            = "noHand"
+ACTIONS                   = [ACTION_PLAY, ACTION_STOP, ACTION_VOLUME_UP, ACTION_VOLUME_DOWN, ACTION_VOLUME_MUTE,
+                             ACTION_NEXT, ACTION_PREVIOUS, ACTION_IGNORE, ACTION_NO_HAND]
+
+
+class GestureRule():
+
+    def __init__(self, name, fingers, orientation, action):
+        if len(fingers) != NUM_FINGERS or set(fingers) - {FINGER_PATTERN_UP, FINGER_PATTERN_DOWN, FINGER_PATTERN_ANY}:
+            raise ValueError("Gesture %r : finger pattern %r must be %d characters of 1, 0 or x"
+                             % (name, fingers, NUM_FINGERS))
+        if orientation != ORIENTATION_ANY and orientation not in ORIENTATION_NAMES:
+            raise ValueError("Gesture %r : unknown orientation %r, expected one of %s"
+                             % (name, orientation, list(ORIENTATION_NAMES) + [ORIENTATION_ANY]))
+        if action not in ACTIONS:
+            raise ValueError("Gesture %r : unknown action %r, expected one of %s" % (name, action, ACTIONS))
+
+        self.name        = name
+        self.fingers     = fingers
+        self.orientation = orientation
+        self.action      = action
+
+    def __repr__(self):
+        return "GestureRule(%r, %r, %r, %r)" % (self.name, self.fingers, self.orientation, self.action)
+
+    def orientations(self):
+        if self.orientation == ORIENTATION_ANY:
+            return [ORIENTATION_UPRIGHT, ORIENTATION_THUMB_UP, ORIENTATION_THUMB_DOWN]
+        return [ORIENTATION_NAMES[self.orientation]]
+
+    def matchingMasks(self):
+        # boolean array over every fingers up mask, bit 0 is the thumb
+        care  = sum(1 << bit for bit, state in enumerate(self.fingers) if state != FINGER_PATTERN_ANY)
+        value = sum(1 << bit for bit, state in enumerate(self.fingers) if state == FINGER_PATTERN_UP)
+        return (np.arange(FINGER_MASK_COUNT) & care) == value
+
+
+class GestureRuleTable():
+
+    def __init__(self, rules):
+        # gesture ids follow the first appearance of every name
+        self.rules    = list(rules)
+        self.gestures = []
+        self.actions  = []
+        self.table    = np.full((ORIENTATION_COUNT, FINGER_MASK_COUNT), -1, dtype=np.int16)
+
+        for rule in self.rules:
+            if rule.name in self.gestures:
+                gestureId = self.gestures.index(rule.name)
+                if self.actions[gestureId] != rule.action:
+                    raise ValueError("Gesture %r is bound to both %r and %r"
+                                     % (rule.name, self.actions[gestureId], rule.action))
+            else:
+                gestureId = len(self.gestures)
+                self.gestures.append(rule.name)
+                self.actions.append(rule.action)
+
+            masks = rule.matchingMasks()
+            for orientation in rule.orientations():
+                row = self.table[orientation]
+                row[(row < 0) & masks] = gestureId
+
+        uncovered = np.argwhere(self.table < 0)
+        if len(uncovered):
+            orientation, mask = uncovered[0]
+            orientationName = [name for name, code in ORIENTATION_NAMES.items() if code == orientation][0]
+            raise ValueError("No gesture rule for orientation %s and fingers %s"
+                             % (orientationName, format(int(mask), "05b")[::-1]))
+
+        self.noHandId   = int(self.table[ORIENTATION_NO_HAND, 0])
+        # upright hand with every finger up, the only pose dynamic rotation follows
+        self.openHandId = int(self.table[ORIENTATION_UPRIGHT, FINGER_MASK_COUNT - 1])
+
+    def lookup(self, orientation, fingersUpMask):
+        return int(self.table[orientation, fingersUpMask])
+
+
+def mergeGestureRules(rules, defaultRules):
+    # rules first, the default rules which share a name with one of them are left out
+    names = {rule.name for rule in rules}
+    return list(rules) + [rule for rule in defaultRules if rule.name not in names]
+
+
+def readGestureRules(path):
+    with open(path) as rulesFile:
+        config = json.load(rulesFile)
+
+    try:
+        return [GestureRule(entry["name"], entry["fingers"], entry.get("orientation", "upright"), entry["action"])
+                for entry in config["gestures"]]
+    except KeyError as e:
+        raise ValueError("%s : missing %s in gesture definition" % (path, e))
@@ -6,26 +6,80 @@ Created on Mon Dec 20 10:11:40 2021
 """
 
 import cv2
+import time
 import numpy as np
-import mediapipe as mp
+from FrameBuffers import ScratchBuffer
+from HandOverlay import drawHands
+from GestureRules import GestureRule, GestureRuleTable, readGestureRules, mergeGestureRules
+from GestureRules import ORIENTATION_UPRIGHT, ORIENTATION_THUMB_UP, ORIENTATION_THUMB_DOWN, ORIENTATION_NO_HAND
+from GestureRules import ACTION_PLAY, ACTION_STOP, ACTION_VOLUME_UP, ACTION_VOLUME_DOWN, ACTION_VOLUME_MUTE
+from GestureRules import ACTION_NEXT, ACTION_PREVIOUS, ACTION_IGNORE, ACTION_NO_HAND
+from HandPolicies import HAND_POLICIES, HAND_POLICY_LARGEST, HAND_POLICY_DOMINANT, HAND_POLICY_CENTER
 
-# Static variables
-mpHands      = mp.solutions.hands
-mpDraw       = mp.solutions.drawing_utils
-mpConnType   = mpHands.HAND_CONNECTIONS
+# Static variables, set by loadMediapipe when the first HandDetector is created
+mpHands      = None
 
 # Constants
 FINGER_POSITION_UP   = 1
 FINGER_POSITION_DOWN = 0
-ALL_FINGERS_UP       = 5
-ALL_FINGERS_DOWN     = 0
+ALL_FINGERS_UP       = 0b11111
+ALL_FINGERS_DOWN     = 0b00000
+VICTORY_FINGERS      = 0b00110
 THUMB_TIP_ID         = 0
 PINKY_TIP_ID         = 4
-AXIS_HORIZONTAL      = 1
-AXIS_VERTICAL        = 2
+AXIS_HORIZONTAL      = 0
+AXIS_VERTICAL        = 1
+AXIS_DEPTH           = 2
+NUM_LANDMARKS        = 21
+NUM_AXES             = 3
 FINGER_TIP_IDS       = [4, 8, 12, 16, 20]
 
-class HandDetector():
+# Classifier tests as (landmarkA, landmarkB, axis), each one meaning A - B < 0 on that axis.
+# They are evaluated together as one matrix product and packed into an integer bitmask.
+THUMB_TIP            = FINGER_TIP_IDS[THUMB_TIP_ID]
+THUMB_IP             = THUMB_TIP - 1
+THUMB_MCP            = THUMB_TIP - 2
+PINKY_PIP            = FINGER_TIP_IDS[PINKY_TIP_ID] - 2
+FINGER_PAIRS         = [(tipId, tipId - 2) for tipId in FINGER_TIP_IDS[1:]]
+VOLUME_PAIRS         = [(THUMB_MCP, PINKY_PIP)] + FINGER_PAIRS
+CLASSIFIER_TESTS     = ([(THUMB_IP, THUMB_TIP, AXIS_HORIZONTAL),                            # bit 0     : right thumb up
+                         (THUMB_TIP, THUMB_IP, AXIS_HORIZONTAL)] +                          # bit 1     : left thumb up
+                        [(tipId, pipId, AXIS_VERTICAL) for tipId, pipId in FINGER_PAIRS] +  # bits 2-5  : fingers up
+                        [(a, b, AXIS_HORIZONTAL) for a, b in VOLUME_PAIRS] +                # bits 6-10 : not left volume
+                        [(b, a, AXIS_HORIZONTAL) for a, b in VOLUME_PAIRS] +                # bits 11-15: not right volume
+                        [(THUMB_IP, THUMB_TIP, AXIS_VERTICAL)])                             # bit 16    : thumb down
+TEST_RIGHT_THUMB_UP  = 1 << 0
+TEST_LEFT_THUMB_UP   = 1 << 1
+TEST_FINGERS_UP      = 0b1111 << 2
+TEST_NOT_LEFT_VOLUME = 0b11111 << 6
+TEST_NOT_RIGHT_VOLUME= 0b11111 << 11
+TEST_THUMB_DOWN      = 1 << 16
+TEST_BITS            = 2 ** np.arange(len(CLASSIFIER_TESTS), dtype=np.int64)
+
+def buildTestMatrix(tests):
+    matrix = np.zeros((len(tests), NUM_LANDMARKS * NUM_AXES))
+    for row, (landmarkA, landmarkB, axis) in enumerate(tests):
+        matrix[row, landmarkA * NUM_AXES + axis] += 1
+        matrix[row, landmarkB * NUM_AXES + axis] -= 1
+    return matrix
+
+TEST_MATRIX          = buildTestMatrix(CLASSIFIER_TESTS)
+
+# Region of interest tracking
+ROI_EXPANSION        = 4.0      # crop side relative to the larger side of the last hand bbox, the palm model misses tighter crops
+ROI_MIN_SIZE         = 96       # pixels
+ROI_MISS_FRAMES      = 15       # full frame searches after the crop lost the hand
+
+def loadMediapipe():
+    # importing mediapipe takes about a second, so the classifier alone never pays for it
+    global mpHands
+    if mpHands is None:
+        import mediapipe as mp
+        mpHands    = mp.solutions.hands
+    return mpHands
+
+
+class HandClassifier():
     
     HAND_DIRECTION_LEFT       = "Left"
     HAND_DIRECTION_RIGHT      = "Right"
@@ -35,140 +89,344 @@ class HandDetector():
     HAND_POSITION_THUMB_UP    = "ThumbUp"
     HAND_POSITION_THUMB_DOWN  = "ThumbDown"
     HAND_POSITION_VICTORY     = "Victory"    
+    HAND_POSITION_INDEX_UP    = "IndexUp"
+    HAND_POSITION_THREE_UP    = "ThreeUp"
     HAND_POSITION_NO_HAND     = "NoHand"
     HAND_POSITION_IGNORE      = "Ignore"
+    
+    def __init__(self, gestureRules=None):
+        self.landmarks     = np.zeros((NUM_LANDMARKS, NUM_AXES))
+        self.handDirection = self.HAND_DIRECTION_NONE
+        self.setGestureRules(DEFAULT_GESTURE_TABLE if gestureRules is None else gestureRules)
         
-    def __init__(self, mode=False, maxHands=2, modelComplexity=1, detectionCon=0.5, trackCon=0.5):        
-        self.hands = mpHands.Hands(mode, maxHands, modelComplexity, detectionCon, trackCon)        
-        self.handDirection = self.HAND_DIRECTION_NONE     
+    def setGestureRules(self, gestureRules):
+        # GestureRuleTable -> gesture id for every (hand direction, landmark tests) pair
+        self.gestureRules = gestureRules
+        self.testTable    = gestureRules.table[TEST_ORIENTATIONS, TEST_FINGER_MASKS]
         
-    def detectHands(self, img, draw=True):
-        img.flags.writeable = False      
-        imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        self.results = self.hands.process(imgRGB)
-        img.flags.writeable = True        
-    
-        if self.results.multi_hand_landmarks and draw:
-            for hand_landmarks in self.results.multi_hand_landmarks:                
-                mpDraw.draw_landmarks(img, hand_landmarks, mpConnType)
+    def setHand(self, landmarks, handDirection):
+        # classify landmarks found by another HandDetector (e.g. in a pipeline stage)
+        np.copyto(self.landmarks, landmarks)
+        self.handDirection = handDirection
         
-        #find landMarks
-        self.findLandMarks(img)
+    def getLandmarkTests(self):
+        # one bit per CLASSIFIER_TESTS entry
+        return int(np.dot(TEST_BITS, np.dot(TEST_MATRIX, self.landmarks.ravel()) < 0))
         
-        return img
-    
-    def findLandMarks(self, img, handNo=0, draw=True):
-        xList = []
-        yList = []
-        bbox = []
-        self.landmarks_list = []
-        self.handDirection = self.HAND_DIRECTION_NONE
-        if self.results.multi_hand_landmarks:
-            if self.results.multi_handedness:
-                # label gives if hand is left or right
-                label = self.results.multi_handedness[handNo].classification[0].label
-                # account for inversion in webcams
-                if label == self.HAND_DIRECTION_LEFT:
-                    self.handDirection = self.HAND_DIRECTION_RIGHT
-                elif label == self.HAND_DIRECTION_RIGHT:
-                    self.handDirection = self.HAND_DIRECTION_LEFT
-                
-            myHand = self.results.multi_hand_landmarks[handNo]
+    def getFingersUpMask(self, tests=None):
+        if tests is None:
+            tests = self.getLandmarkTests()
             
-            for id, landmark in enumerate(myHand.landmark):
-                h, w, c = img.shape
-                cx, cy = int(landmark.x * w), int(landmark.y * h)
-                xList.append(cx)
-                yList.append(cy)
-                
-                self.landmarks_list.append([id, cx, cy, label])        
-                xmin, xmax = min(xList), max(xList)
-                ymin, ymax = min(yList), max(yList)
-                bbox = xmin, ymin, xmax, ymax
-                
-                # draw fingers
-                if draw:
-                    cv2.circle(img, (cx, cy), 3, (255, 0, 255), cv2.FILLED)
-    
-            if draw:
-                cv2.rectangle(img, (bbox[0] - 20, bbox[1] - 20),(bbox[2] + 20, bbox[3] + 20), (0, 255, 0), 2)
-    
-        return self.landmarks_list, bbox
-    
-    def getFingersUp(self):
-        fingers = []
         # Thumb
-        if self.handDirection == self.HAND_DIRECTION_RIGHT  and self.getFingerHorizontalPosition(FINGER_TIP_IDS[THUMB_TIP_ID]) > self.getFingerHorizontalPosition(FINGER_TIP_IDS[THUMB_TIP_ID]-1):  #Right Thumb    
-            fingers.append(FINGER_POSITION_UP)
-        elif self.handDirection == self.HAND_DIRECTION_LEFT and self.getFingerHorizontalPosition(FINGER_TIP_IDS[THUMB_TIP_ID]) < self.getFingerHorizontalPosition(FINGER_TIP_IDS[THUMB_TIP_ID]-1):  #Left Thumb    
-            fingers.append(FINGER_POSITION_UP)
+        if self.handDirection == self.HAND_DIRECTION_RIGHT:     #Right Thumb
+            thumb = tests & TEST_RIGHT_THUMB_UP
+        elif self.handDirection == self.HAND_DIRECTION_LEFT:    #Left Thumb
+            thumb = (tests & TEST_LEFT_THUMB_UP) >> 1
         else:
-            fingers.append(FINGER_POSITION_DOWN)
-                   
-        # Other Fingers
-        for id in range(1, 5):
-            if self.getFingerVerticalPosition(FINGER_TIP_IDS[id]) < self.getFingerVerticalPosition(FINGER_TIP_IDS[id] - 2):
-                fingers.append(FINGER_POSITION_UP)
-            else:
-                fingers.append(FINGER_POSITION_DOWN)
-                    
-        return fingers
+            thumb = FINGER_POSITION_DOWN
+            
+        # Other Fingers : bits 2-5 become bits 1-4
+        return thumb | ((tests & TEST_FINGERS_UP) >> 1)
+        
+    def getFingersUp(self, tests=None):
+        upFingers = self.getFingersUpMask(tests)
+        return [(upFingers >> id) & FINGER_POSITION_UP for id in range(len(FINGER_TIP_IDS))]
     
-    def isVolumePosition(self):    
-        if self.handDirection == self.HAND_DIRECTION_LEFT:
-            # Is hand vertical
-            if self.getFingerHorizontalPosition(FINGER_TIP_IDS[THUMB_TIP_ID]-2) < self.getFingerHorizontalPosition(FINGER_TIP_IDS[PINKY_TIP_ID] - 2):
-                return False
+    def isVolumePosition(self, tests=None):    
+        if tests is None:
+            tests = self.getLandmarkTests()
             
-            for id in range(1, 5):
-                if self.getFingerHorizontalPosition(FINGER_TIP_IDS[id]) < self.getFingerHorizontalPosition(FINGER_TIP_IDS[id] - 2):
-                    return False
+        # hand is vertical and every finger points to the thumb side
+        if self.handDirection == self.HAND_DIRECTION_LEFT:
+            return not tests & TEST_NOT_LEFT_VOLUME
         else:
-             # Is hand vertical
-            if self.getFingerHorizontalPosition(FINGER_TIP_IDS[THUMB_TIP_ID]-2) > self.getFingerHorizontalPosition(FINGER_TIP_IDS[PINKY_TIP_ID] - 2):
-                return False
-            
-            for id in range(1, 5):
-                if self.getFingerHorizontalPosition(FINGER_TIP_IDS[id]) > self.getFingerHorizontalPosition(FINGER_TIP_IDS[id] - 2):
-                    return False         
-                    
-        return True
+            return not tests & TEST_NOT_RIGHT_VOLUME
         
     def getFingerHorizontalPosition(self, finderId):        
-        try:
-            return self.landmarks_list[finderId][AXIS_HORIZONTAL]
-        except (IndexError, ValueError):
-            return FINGER_POSITION_DOWN
+        return self.landmarks[finderId, AXIS_HORIZONTAL]
     
     def getFingerVerticalPosition(self, finderId):        
-        try:
-            return self.landmarks_list[finderId][AXIS_VERTICAL]
-        except (IndexError, ValueError):
-            return FINGER_POSITION_DOWN
+        return self.landmarks[finderId, AXIS_VERTICAL]
+        
+    def getGestureId(self):
+        return int(self.testTable[DIRECTION_ROWS.get(self.handDirection, 0), self.getLandmarkTests()])
         
     def getHandPosition(self):
-        upFingers      = self.getFingersUp()
-        sumOfUpFingers = np.sum(upFingers)
-        
-        try:
-            if self.handDirection == self.HAND_DIRECTION_NONE:
-                return self.HAND_POSITION_NO_HAND     
-            elif self.isVolumePosition():
-                if self.getFingerVerticalPosition(FINGER_TIP_IDS[THUMB_TIP_ID]) > self.getFingerVerticalPosition(FINGER_TIP_IDS[THUMB_TIP_ID] - 1):
-                    return self.HAND_POSITION_THUMB_DOWN
-                else:
-                    return self.HAND_POSITION_THUMB_UP
-            elif sumOfUpFingers == 2 and upFingers[1] == FINGER_POSITION_UP and upFingers[2] == FINGER_POSITION_UP:
-                return self.HAND_POSITION_VICTORY
-            elif sumOfUpFingers == ALL_FINGERS_UP:
-                return self.HAND_POSITION_OPEN
-            elif sumOfUpFingers == ALL_FINGERS_DOWN:
-                return self.HAND_POSITION_CLOSE
-            else:
-                return self.HAND_POSITION_IGNORE
-        except (IndexError, ValueError):
-            return self.HAND_POSITION_IGNORE
+        return self.gestureRules.gestures[self.getGestureId()]
         
+    def classifyHandIds(self, handLandmarks, handDirections):
+        # getGestureId for (N, 21, 3) landmarks and N hand directions in one pass
+        handCount = len(handDirections)
+        if handCount == 0:
+            return np.zeros(0, dtype=self.testTable.dtype)
+        
+        flat  = np.reshape(handLandmarks, (handCount, NUM_LANDMARKS * NUM_AXES))
+        tests = np.dot(np.dot(flat, TEST_MATRIX.T) < 0, TEST_BITS)
+        rows  = [DIRECTION_ROWS.get(direction, 0) for direction in handDirections]
+        return self.testTable[rows, tests]
+        
+    def classifyHands(self, handLandmarks, handDirections):
+        gestures = self.gestureRules.gestures
+        return [gestures[gestureId] for gestureId in self.classifyHandIds(handLandmarks, handDirections).tolist()]
+
+
+# Rows of the test tables, row 0 is for HAND_DIRECTION_NONE
+DIRECTION_ROWS = {HandClassifier.HAND_DIRECTION_LEFT: 1, HandClassifier.HAND_DIRECTION_RIGHT: 2}
+
+def buildTestTables():
+    # hand orientation and fingers up mask for every (hand direction, landmark tests) pair
+    tests     = np.arange(1 << len(CLASSIFIER_TESTS))
+    fingersUp = (tests & TEST_FINGERS_UP) >> 1
+    thumbSide = np.where(tests & TEST_THUMB_DOWN, ORIENTATION_THUMB_DOWN, ORIENTATION_THUMB_UP)
+    
+    orientations = np.full((len(DIRECTION_ROWS) + 1, len(tests)), ORIENTATION_NO_HAND, dtype=np.uint8)
+    fingerMasks  = np.zeros((len(DIRECTION_ROWS) + 1, len(tests)), dtype=np.uint8)
+    for direction, row in DIRECTION_ROWS.items():
+        if direction == HandClassifier.HAND_DIRECTION_RIGHT:
+            thumb, notVolume = tests & TEST_RIGHT_THUMB_UP, TEST_NOT_RIGHT_VOLUME
+        else:
+            thumb, notVolume = (tests & TEST_LEFT_THUMB_UP) >> 1, TEST_NOT_LEFT_VOLUME
+        fingerMasks[row]  = thumb | fingersUp
+        # hand is vertical and every finger points to the thumb side : volume gestures
+        orientations[row] = np.where(tests & notVolume, ORIENTATION_UPRIGHT, thumbSide)
+    return orientations, fingerMasks
+
+TEST_ORIENTATIONS, TEST_FINGER_MASKS = buildTestTables()
+
+# Built in gestures, rules loaded from a file take precedence and replace the ones with their name
+DEFAULT_GESTURE_RULES = [
+    GestureRule(HandClassifier.HAND_POSITION_THUMB_UP,   "xxxxx", "thumbUp",   ACTION_VOLUME_UP),
+    GestureRule(HandClassifier.HAND_POSITION_THUMB_DOWN, "xxxxx", "thumbDown", ACTION_VOLUME_DOWN),
+    GestureRule(HandClassifier.HAND_POSITION_VICTORY,    "01100", "upright",   ACTION_VOLUME_MUTE),
+    GestureRule(HandClassifier.HAND_POSITION_OPEN,       "11111", "upright",   ACTION_STOP),
+    GestureRule(HandClassifier.HAND_POSITION_CLOSE,      "00000", "upright",   ACTION_PLAY),
+    GestureRule(HandClassifier.HAND_POSITION_INDEX_UP,   "01000", "upright",   ACTION_NEXT),
+    GestureRule(HandClassifier.HAND_POSITION_THREE_UP,   "01110", "upright",   ACTION_PREVIOUS),
+    GestureRule(HandClassifier.HAND_POSITION_IGNORE,     "xxxxx", "upright",   ACTION_IGNORE),
+    GestureRule(HandClassifier.HAND_POSITION_NO_HAND,    "xxxxx", "noHand",    ACTION_NO_HAND),
+]
+
+DEFAULT_GESTURE_TABLE = GestureRuleTable(DEFAULT_GESTURE_RULES)
+
+def loadGestureRules(path):
+    return GestureRuleTable(mergeGestureRules(readGestureRules(path), DEFAULT_GESTURE_RULES))
+
+
+class HandDetector(HandClassifier):
+        
+    def __init__(self, mode=False, maxHands=2, modelComplexity=1, detectionCon=0.5, trackCon=0.5, motionGate=None,
+                 roiTracking=False, searchSize=None, metrics=None, handPolicy=HAND_POLICY_LARGEST,
+                 dominantHand=HandClassifier.HAND_DIRECTION_RIGHT, gestureRules=None, loadModel=True):        
+        super().__init__(gestureRules)
+        if handPolicy not in HAND_POLICIES:
+            raise ValueError("Unknown hand policy %r, expected one of %s" % (handPolicy, HAND_POLICIES))
+        self.mode            = mode
+        self.maxHands        = maxHands
+        self.modelComplexity = modelComplexity
+        self.detectionCon    = detectionCon
+        self.trackCon        = trackCon
+        # without the model (replaying recorded landmarks through setHands) mediapipe is not even imported
+        self.hands = loadMediapipe().Hands(mode, maxHands, modelComplexity, detectionCon, trackCon) if loadModel else None
+        self.motionGate       = motionGate
+        self.inferenceSkipped = False
+        # run the model on every inferenceInterval-th frame only
+        self.inferenceInterval = 1
+        self.frameCounter      = 0
+        # crop around the last hand instead of sending the full frame to the model
+        self.roiTracking      = roiTracking
+        # full frame searches are downscaled so that the larger side is at most searchSize pixels
+        self.searchSize       = searchSize
+        self.region           = None
+        self.roiMissFrames    = 0
+        self.bbox             = []
+        self.results          = None
+        # every detected hand; landmarks, handDirection and bbox belong to the controlling one
+        self.handPolicy       = handPolicy
+        self.dominantHand     = dominantHand
+        self.handLandmarks    = np.zeros((0, NUM_LANDMARKS, NUM_AXES))
+        self.rawLandmarks     = self.handLandmarks
+        self.handDirections   = []
+        self.handBoxes        = np.zeros((0, 4), dtype=int)
+        self.controlIndex     = -1
+        self.landmarkBuffer   = ScratchBuffer(np.float64)
+        self.rawBuffer        = ScratchBuffer(np.float64)
+        # model input buffers, reused between frames
+        self.scaledBuffer     = ScratchBuffer()
+        self.rgbBuffer        = ScratchBuffer()
+        # optional StageMetrics receiving the time of every detection stage
+        self.metrics          = metrics
+        
+    def recordStage(self, stage, startTime):
+        endTime = time.perf_counter()
+        if self.metrics is not None:
+            self.metrics.record(stage, endTime - startTime)
+        return endTime
+        
+    def configure(self, modelComplexity=None, maxHands=None, searchSize=None, inferenceInterval=None):
+        # must be called from the thread which runs detectHands
+        if searchSize is not None:
+            self.searchSize = searchSize
+        if inferenceInterval is not None:
+            self.inferenceInterval = inferenceInterval
+            
+        modelComplexity = self.modelComplexity if modelComplexity is None else modelComplexity
+        maxHands        = self.maxHands if maxHands is None else maxHands
+        if (modelComplexity, maxHands) != (self.modelComplexity, self.maxHands) and self.hands is not None:
+            self.hands.close()
+            self.modelComplexity = modelComplexity
+            self.maxHands        = maxHands
+            self.hands = mpHands.Hands(self.mode, maxHands, modelComplexity, self.detectionCon, self.trackCon)
+            
+    def close(self):
+        if self.hands is not None:
+            self.hands.close()
+            self.hands = None
+            
+    def getTrackingRegion(self, img):
+        # square around all the hands found in the last frame
+        h, w, c = img.shape
+        xmin, ymin = self.handBoxes[:, :2].min(axis=0)
+        xmax, ymax = self.handBoxes[:, 2:].max(axis=0)
+        half = max(xmax - xmin, ymax - ymin, ROI_MIN_SIZE / ROI_EXPANSION) * ROI_EXPANSION / 2
+        cx, cy = (xmin + xmax) / 2, (ymin + ymax) / 2
+        return max(int(cx - half), 0), max(int(cy - half), 0), min(int(cx + half), w), min(int(cy + half), h)
+    
+    def getSearchScale(self, region):
+        x0, y0, x1, y1 = region
+        size = max(x1 - x0, y1 - y0)
+        if self.searchSize is None or size <= self.searchSize:
+            return 1.0
+        return self.searchSize / size
+        
+    def processRegion(self, img, region, scale=1.0):
+        # landmarks of the results are normalized to region, findLandMarks maps them back
+        startTime = time.perf_counter()
+        x0, y0, x1, y1 = region
+        imgRegion = img[y0:y1, x0:x1]
+        if scale < 1.0:
+            size = (max(int(round((x1 - x0) * scale)), 1), max(int(round((y1 - y0) * scale)), 1))
+            imgRegion = cv2.resize(imgRegion, size, dst=self.scaledBuffer.view((size[1], size[0], 3)),
+                                   interpolation=cv2.INTER_AREA)
+        imgRGB = cv2.cvtColor(imgRegion, cv2.COLOR_BGR2RGB, dst=self.rgbBuffer.view(imgRegion.shape))
+        self.region = region
+        startTime = self.recordStage("convert", startTime)
+        
+        results = self.hands.process(imgRGB)
+        self.recordStage("inference", startTime)
+        return results
+        
+    def detectHands(self, img, draw=True):
+        # reduced inference rate or static scene : keep the previous results instead of running the model again
+        startTime = time.perf_counter()
+        self.frameCounter += 1
+        self.inferenceSkipped = self.results is not None and (
+                                 self.frameCounter % self.inferenceInterval != 0 or
+                                 (self.motionGate is not None and self.motionGate.isStatic(img)))
+        if self.motionGate is not None:
+            self.recordStage("motionGate", startTime)
+        
+        if not self.inferenceSkipped:
+            img.flags.writeable = False      
+            self.results = None
+            if self.roiTracking and self.bbox and self.roiMissFrames == 0:
+                # hands far apart give a large region, which is downscaled like a full frame search
+                region = self.getTrackingRegion(img)
+                self.results = self.processRegion(img, region, self.getSearchScale(region))
+                if not self.results.multi_hand_landmarks:
+                    # the next frames search the whole frame directly instead of running the model twice
+                    self.roiMissFrames = ROI_MISS_FRAMES
+            elif self.roiMissFrames > 0:
+                self.roiMissFrames -= 1
+            
+            # hand lost (or not tracking) : search the whole frame
+            if self.results is None or not self.results.multi_hand_landmarks:
+                h, w, c = img.shape
+                region = (0, 0, w, h)
+                self.results = self.processRegion(img, region, self.getSearchScale(region))
+            img.flags.writeable = True        
+        
+        #find landMarks
+        startTime = time.perf_counter()
+        self.findLandMarks(img, draw=False)
+        startTime = self.recordStage("landmarks", startTime)
+    
+        if self.results.multi_hand_landmarks and draw:
+            self.drawLandMarks(img)
+            self.recordStage("draw", startTime)
+        
+        return img
+    
+    def findLandMarks(self, img, handNo=None, draw=True):
+        # all hands at once; handNo None lets handPolicy choose the controlling hand
+        hands = self.results.multi_hand_landmarks or []
+        rawLandmarks   = self.rawBuffer.view((len(hands), NUM_LANDMARKS, NUM_AXES))
+        handDirections = []
+        if hands:
+            rawLandmarks.reshape(-1, NUM_AXES)[:] = [(landmark.x, landmark.y, landmark.z)
+                                                     for hand in hands for landmark in hand.landmark]
+            
+            # label gives if hand is left or right, accounting for inversion in webcams
+            mirrored = {self.HAND_DIRECTION_LEFT: self.HAND_DIRECTION_RIGHT,
+                        self.HAND_DIRECTION_RIGHT: self.HAND_DIRECTION_LEFT}
+            handedness = self.results.multi_handedness or []
+            handDirections = [mirrored.get(handedness[i].classification[0].label, self.HAND_DIRECTION_NONE)
+                              if i < len(handedness) else self.HAND_DIRECTION_NONE for i in range(len(hands))]
+            
+        self.setHands(rawLandmarks, handDirections, img.shape, self.region, handNo)
+        if draw:
+            self.drawLandMarks(img)
+    
+        return self.landmarks, self.bbox        
+        
+    def setHands(self, rawLandmarks, handDirections, imageShape, region=None, handNo=None):
+        # (N, 21, 3) model landmarks normalized to region (whole image when None), e.g. from a recording
+        bbox = []
+        self.rawLandmarks   = rawLandmarks
+        self.handDirections = handDirections
+        self.handDirection  = self.HAND_DIRECTION_NONE
+        self.controlIndex   = -1
+        self.handLandmarks  = self.landmarkBuffer.view(rawLandmarks.shape)
+        if len(handDirections):
+            # normalized to the inference region -> full frame pixel coordinates, truncated like int()
+            np.copyto(self.handLandmarks, rawLandmarks)
+            h, w = imageShape[:2]
+            x0, y0, x1, y1 = region if region else (0, 0, w, h)
+            points = self.handLandmarks[:, :, :AXIS_DEPTH]
+            points *= (x1 - x0, y1 - y0)
+            points += (x0, y0)
+            np.trunc(points, out=points)
+            
+            self.handBoxes = np.concatenate((points.min(axis=1), points.max(axis=1)), axis=1).astype(int)
+            self.controlIndex = self.selectControllingHand(imageShape) if handNo is None else handNo
+            
+            np.copyto(self.landmarks, self.handLandmarks[self.controlIndex])
+            self.handDirection = self.handDirections[self.controlIndex]
+            bbox = tuple(int(value) for value in self.handBoxes[self.controlIndex])
+        else:
+            self.handBoxes = self.handBoxes[:0]
+                
+        self.bbox = bbox
+    
+    def selectControllingHand(self, imageShape):
+        xmin, ymin, xmax, ymax = self.handBoxes.T
+        areas = (xmax - xmin) * (ymax - ymin)
+        if self.handPolicy == HAND_POLICY_CENTER:
+            h, w = imageShape[:2]
+            return int(np.argmin((xmin + xmax - w) ** 2 + (ymin + ymax - h) ** 2))
+        if self.handPolicy == HAND_POLICY_DOMINANT:
+            # largest dominant hand, any hand when the dominant one is not visible
+            dominant = np.asarray(self.handDirections) == self.dominantHand
+            if dominant.any():
+                return int(np.argmax(np.where(dominant, areas, -1)))
+        return int(np.argmax(areas))
+        
+    def getHandPositions(self):
+        # gesture of every detected hand, in the order of handDirections and handBoxes
+        return self.classifyHands(self.handLandmarks, self.handDirections)
+    
+    def drawLandMarks(self, img):
+        # skeleton of every hand, the controlling hand has the green box
+        drawHands(img, self.handLandmarks, self.handBoxes, self.controlIndex)
 
 # For testing....
 if False:
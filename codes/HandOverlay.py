@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Hand overlay drawn in a few batched OpenCV calls, whatever the number of hands.
+
+The hand skeleton is split into polylines of equal length, so the connections
+of every hand are gathered with one fancy index per length and drawn by a
+single cv2.polylines call each. Landmark points are zero length segments of a
+thick polyline, the hand boxes closed polylines grouped by colour. The player
+draws it on the frame it is about to display, after inference is done with it.
+"""
+
+import numpy as np
+import cv2
+
+# Constants
+# skeleton of the 21 landmarks as polylines, grouped by length : fingers from the wrist, then the rest
+HAND_CHAINS_LONG   = np.array([[0, 1, 2, 3, 4], [0, 5, 6, 7, 8], [0, 17, 18, 19, 20]])
+HAND_CHAINS_SHORT  = np.array([[9, 10, 11, 12], [13, 14, 15, 16], [5, 9, 13, 17]])
+LINE_COLOR         = (255, 255, 255)
+POINT_COLOR        = (255, 0, 255)
+CONTROL_BOX_COLOR  = (0, 255, 0)
+OTHER_BOX_COLOR    = (128, 128, 128)
+LINE_THICKNESS     = 2
+POINT_THICKNESS    = 6
+BOX_THICKNESS      = 2
+BOX_MARGIN         = 20
+
+
+def drawHands(img, handLandmarks, handBoxes, controlIndex=-1):
+    # handLandmarks (hands, 21, >= 2) and handBoxes (hands, 4) in image pixels; the controlling hand has the green box
+    handCount = len(handLandmarks)
+    if handCount == 0:
+        return img
+
+    points = np.rint(handLandmarks[:, :, :2]).astype(np.int32)
+    for chains in (HAND_CHAINS_LONG, HAND_CHAINS_SHORT):
+        cv2.polylines(img, points[:, chains].reshape(-1, chains.shape[1], 2), False, LINE_COLOR, LINE_THICKNESS)
+
+    dots = np.repeat(points.reshape(-1, 1, 2), 2, axis=1)
+    cv2.polylines(img, dots, False, POINT_COLOR, POINT_THICKNESS)
+
+    x0, y0, x1, y1 = (np.asarray(handBoxes, dtype=np.int32) + [-BOX_MARGIN, -BOX_MARGIN, BOX_MARGIN, BOX_MARGIN]).T
+    corners = np.stack([np.stack([x0, y0], 1), np.stack([x1, y0], 1), np.stack([x1, y1], 1), np.stack([x0, y1], 1)], 1)
+    isControl = np.arange(handCount) == controlIndex
+    if isControl.any():
+        cv2.polylines(img, corners[isControl], True, CONTROL_BOX_COLOR, BOX_THICKNESS)
+    if not isControl.all():
+        cv2.polylines(img, corners[~isControl], True, OTHER_BOX_COLOR, BOX_THICKNESS)
+    return img
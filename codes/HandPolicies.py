@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+Controlling hand policies, used when more than one hand is detected.
+
+Kept apart from HandDetector, which imports cv2 and numpy, so command line
+parsers can check --hand-policy before the detector is imported.
+"""
+
+# Constants
+HAND_POLICY_LARGEST  = "largest"
+HAND_POLICY_DOMINANT = "dominant"
+HAND_POLICY_CENTER   = "center"
+HAND_POLICIES        = [HAND_POLICY_LARGEST, HAND_POLICY_DOMINANT, HAND_POLICY_CENTER]
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Compact landmark recordings, to debug misfires and tune gestures without a camera.
+
+LandmarkRecorder appends one fixed size record per classified frame : capture
+time, image size, inference region, the landmarks of every hand as the model
+returned them, their directions and gesture ids. LandmarkReplay memory-maps
+such a file and feeds every record through HandDetector.setHands and the
+gesture rules, so hours of sessions replay in seconds and always give the
+same gestures.
+
+Usage : python LandmarkRecording.py session.lmk [--gestures gestures.json]
+"""
+
+import os
+import sys
+import time
+import argparse
+import collections
+import numpy as np
+from HandDetector import HandDetector, HandClassifier, loadGestureRules, DIRECTION_ROWS, NUM_LANDMARKS, NUM_AXES
+from HandPolicies import HAND_POLICIES, HAND_POLICY_LARGEST
+
+# Constants
+FILE_MAGIC           = b"LMK1"
+HEADER_DTYPE         = np.dtype([("magic", "S4"), ("maxHands", "<u2"), ("recordSize", "<u2")])
+DEFAULT_MAX_HANDS    = 2
+CHANGED_FRAMES_SHOWN = 10
+
+# Direction codes stored in the records, DIRECTION_ROWS of the classifier
+DIRECTION_NAMES = [HandClassifier.HAND_DIRECTION_NONE] * (len(DIRECTION_ROWS) + 1)
+for direction, code in DIRECTION_ROWS.items():
+    DIRECTION_NAMES[code] = direction
+
+
+def recordDtype(maxHands):
+    # packed, landmarks stay float32 like the model output so nothing is lost
+    return np.dtype([
+        ("frameId",      "<u4"),
+        ("captureTime",  "<f8"),
+        ("imageSize",    "<u2", (2,)),      # height, width
+        ("region",       "<u2", (4,)),      # x0, y0, x1, y1 the landmarks are normalized to
+        ("handCount",    "u1"),
+        ("controlIndex", "i1"),
+        ("directions",   "u1", (maxHands,)),
+        ("gestureIds",   "<i2", (maxHands,)),
+        ("landmarks",    "<f4", (maxHands, NUM_LANDMARKS, NUM_AXES)),
+    ])
+
+
+class LandmarkRecorder():
+
+    def __init__(self, path, maxHands=DEFAULT_MAX_HANDS):
+        self.path     = path
+        self.maxHands = maxHands
+        self.buffer   = np.zeros(1, recordDtype(maxHands))
+        self.frames   = 0
+
+        # a new file gets a header, an existing one must have the same record layout
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            header = readHeader(path)
+            if header["maxHands"] != maxHands:
+                raise ValueError("%s records %d hands per frame, not %d" % (path, header["maxHands"], maxHands))
+            self.file = open(path, "ab")
+        else:
+            self.file = open(path, "wb")
+            header = np.array([(FILE_MAGIC, maxHands, self.buffer.itemsize)], dtype=HEADER_DTYPE)
+            self.file.write(header.tobytes())
+
+    def write(self, frameId, captureTime, imageShape, region, rawLandmarks, handDirections, gestureIds, controlIndex):
+        handCount = min(len(handDirections), self.maxHands)
+        height, width = imageShape[:2]
+
+        record = self.buffer[0]
+        record["frameId"]      = frameId
+        record["captureTime"]  = captureTime
+        record["imageSize"]    = (height, width)
+        record["region"]       = region if region else (0, 0, width, height)
+        record["handCount"]    = handCount
+        record["controlIndex"] = controlIndex
+        record["directions"][:] = 0
+        record["gestureIds"][:] = -1
+        record["landmarks"][:]  = 0
+        record["directions"][:handCount] = [DIRECTION_ROWS.get(direction, 0) for direction in handDirections[:handCount]]
+        record["gestureIds"][:handCount] = gestureIds[:handCount]
+        record["landmarks"][:handCount]  = rawLandmarks[:handCount]
+
+        self.file.write(self.buffer.tobytes())
+        self.frames += 1
+
+    def close(self):
+        self.file.close()
+
+
+def readHeader(path):
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header[0]["magic"] != FILE_MAGIC:
+        raise ValueError("%s is not a landmark recording" % path)
+    if header[0]["recordSize"] != recordDtype(header[0]["maxHands"]).itemsize:
+        raise ValueError("%s has an unknown record layout" % path)
+    return header[0]
+
+
+class LandmarkReplay():
+
+    def __init__(self, path):
+        header = readHeader(path)
+        self.path     = path
+        self.maxHands = int(header["maxHands"])
+        dtype = recordDtype(self.maxHands)
+
+        # a record cut short by a crash at the end of the file is ignored
+        count = (os.path.getsize(path) - HEADER_DTYPE.itemsize) // dtype.itemsize
+        if count > 0:
+            self.records = np.memmap(path, dtype=dtype, mode="r", offset=HEADER_DTYPE.itemsize, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def replay(self, handDetector):
+        # yields (record, gesture id of the controlling hand) after feeding the record to handDetector
+        for record in self.records:
+            handCount  = record["handCount"]
+            directions = [DIRECTION_NAMES[code] for code in record["directions"][:handCount].tolist()]
+            handDetector.setHands(record["landmarks"][:handCount], directions, record["imageSize"],
+                                  tuple(record["region"].tolist()))
+            yield record, handDetector.getGestureId()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a landmark recording through the gesture classifier.")
+    parser.add_argument("recording", help="file written with MediaPlayer.py --record")
+    parser.add_argument("--gestures", help="JSON file with additional gesture rules")
+    parser.add_argument("--hand-policy", default=HAND_POLICY_LARGEST, choices=HAND_POLICIES)
+    args = parser.parse_args(argv)
+
+    gestureRules = loadGestureRules(args.gestures) if args.gestures else None
+    handDetector = HandDetector(handPolicy=args.hand_policy, gestureRules=gestureRules, loadModel=False)
+    gestures     = handDetector.gestureRules.gestures
+    replay       = LandmarkReplay(args.recording)
+
+    counts  = collections.Counter()
+    changed = []
+    startTime = time.perf_counter()
+    for record, gestureId in replay.replay(handDetector):
+        counts[gestures[gestureId]] += 1
+        # recorded gesture of the controlling hand, ids are only comparable with the same rules
+        controlIndex = record["controlIndex"]
+        recordedId   = record["gestureIds"][controlIndex] if 0 <= controlIndex < record["handCount"] else -1
+        if gestureRules is None and recordedId >= 0 and recordedId != gestureId:
+            changed.append(int(record["frameId"]))
+    elapsed = time.perf_counter() - startTime
+    handDetector.close()
+
+    print("%s : %d frames replayed in %.2f s (%.0f frames/s)" % (
+        args.recording, len(replay), elapsed, len(replay) / elapsed if elapsed > 0 else 0.0))
+    for gesture, count in counts.most_common():
+        print("    %-12s %8d" % (gesture, count))
+    if changed:
+        print("%d frames classified differently than recorded, first frames : %s" % (
+            len(changed), changed[:CHANGED_FRAMES_SHOWN]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
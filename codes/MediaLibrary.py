@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Media library : indexed media folders with durations and thumbnails.
+
+scan() walks the given folders for media files. Files whose size and
+modification time match the on-disk index come straight from it; the others
+are opened with OpenCV by a thread pool to read their duration and save a
+thumbnail. Items are handed to a callback in batches as soon as they are
+known, so the playlist fills up while the scan is still running, and a folder
+of thousands of indexed files loads in about the time it takes to list it.
+Files which disappeared are dropped from the index, and their thumbnails
+deleted, when their folder is scanned again. Nothing here imports Qt.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import concurrent.futures
+import cv2
+
+# Constants
+DEFAULT_CACHE_DIR     = os.path.join(os.path.expanduser("~"), ".cache", "gesture_media_player")
+INDEX_FILE_NAME       = "library.json"
+THUMBNAIL_DIR_NAME    = "thumbnails"
+INDEX_VERSION         = 1
+MEDIA_EXTENSIONS      = {".mp4", ".avi", ".mkv", ".mov", ".wmv", ".webm", ".m4v", ".mpg", ".mpeg",
+                         ".mp3", ".wav", ".m4a", ".flac", ".ogg", ".wma"}
+THUMBNAIL_WIDTH       = 160
+THUMBNAIL_POSITION    = 0.1       # fraction of the video the thumbnail is taken at
+THUMBNAIL_QUALITY     = 80
+BATCH_SIZE            = 200       # items per callback
+DEFAULT_WORKERS       = min(8, (os.cpu_count() or 1) + 4)
+
+logger = logging.getLogger(__name__)
+
+
+class MediaItem():
+
+    def __init__(self, path, size, mtime, duration=None, thumbnail=None):
+        self.path      = path
+        self.size      = size
+        self.mtime     = mtime
+        # seconds, None when OpenCV cannot read the file (e.g. audio)
+        self.duration  = duration
+        self.thumbnail = thumbnail
+
+    def __repr__(self):
+        return "MediaItem(%r, duration=%r)" % (self.path, self.duration)
+
+    def name(self):
+        return os.path.basename(self.path)
+
+    def toJson(self):
+        return {"size": self.size, "mtime": self.mtime, "duration": self.duration, "thumbnail": self.thumbnail}
+
+    @staticmethod
+    def fromJson(path, entry):
+        return MediaItem(path, entry["size"], entry["mtime"], entry.get("duration"), entry.get("thumbnail"))
+
+
+def isMediaFile(name):
+    return os.path.splitext(name)[1].lower() in MEDIA_EXTENSIONS
+
+
+def listMediaFiles(directory):
+    # (path, size, mtime) of every media file under directory
+    pending = [directory]
+    while pending:
+        try:
+            entries = list(os.scandir(pending.pop()))
+        except OSError as e:
+            logger.warning("Cannot list %s : %s", e.filename, e.strerror)
+            continue
+
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file() and isMediaFile(entry.name):
+                    stat = entry.stat()
+                    yield os.path.abspath(entry.path), stat.st_size, stat.st_mtime
+            except OSError:
+                continue
+
+
+class MediaLibrary():
+
+    def __init__(self, cacheDir=DEFAULT_CACHE_DIR, workers=DEFAULT_WORKERS):
+        self.cacheDir     = cacheDir
+        self.indexPath    = os.path.join(cacheDir, INDEX_FILE_NAME)
+        self.thumbnailDir = os.path.join(cacheDir, THUMBNAIL_DIR_NAME)
+        self.workers      = workers
+        self.entries      = self.loadIndex()
+        # one scan at a time, they share the index
+        self.lock         = threading.Lock()
+
+    def loadIndex(self):
+        # path -> MediaItem; an unreadable or older index is rebuilt by the next scan
+        try:
+            with open(self.indexPath) as indexFile:
+                index = json.load(indexFile)
+            if index.get("version") != INDEX_VERSION:
+                return {}
+            return {path: MediaItem.fromJson(path, entry) for path, entry in index["items"].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def saveIndex(self):
+        # written next to the index and renamed, a crash never leaves half an index
+        os.makedirs(self.cacheDir, exist_ok=True)
+        index = {"version": INDEX_VERSION, "items": {path: item.toJson() for path, item in self.entries.items()}}
+        temporaryPath = self.indexPath + ".tmp"
+        with open(temporaryPath, "w") as indexFile:
+            json.dump(index, indexFile)
+        os.replace(temporaryPath, self.indexPath)
+
+    def scan(self, directories, onItems):
+        # blocks until every folder is indexed, onItems(list of MediaItem) is called from this thread
+        with self.lock:
+            startTime = time.monotonic()
+            found     = {}
+            batch     = []
+            extracted = 0
+            os.makedirs(self.thumbnailDir, exist_ok=True)
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = []
+                for directory in directories:
+                    for path, size, mtime in listMediaFiles(directory):
+                        cached = self.entries.get(path)
+                        if cached is not None and cached.size == size and cached.mtime == mtime:
+                            found[path] = cached
+                            batch.append(cached)
+                            if len(batch) >= BATCH_SIZE:
+                                onItems(batch)
+                                batch = []
+                        else:
+                            futures.append(executor.submit(self.readMediaItem, path, size, mtime))
+
+                if batch:
+                    onItems(batch)
+                    batch = []
+                for future in concurrent.futures.as_completed(futures):
+                    item = future.result()
+                    found[item.path] = item
+                    batch.append(item)
+                    extracted += 1
+                    if len(batch) >= BATCH_SIZE:
+                        onItems(batch)
+                        batch = []
+                if batch:
+                    onItems(batch)
+
+            # files of the scanned folders which are gone are forgotten, with their thumbnails
+            roots = tuple(os.path.join(os.path.abspath(directory), "") for directory in directories)
+            for path in [path for path in self.entries if path.startswith(roots) and path not in found]:
+                self.removeThumbnail(self.entries.pop(path))
+            self.entries.update(found)
+            self.saveIndex()
+
+            logger.info("Indexed %d media files in %.2f s, %d read from the files, the others from %s",
+                        len(found), time.monotonic() - startTime, extracted, self.indexPath)
+            return list(found.values())
+
+    def removeThumbnail(self, item):
+        if item.thumbnail is not None:
+            try:
+                os.remove(item.thumbnail)
+            except OSError:
+                pass
+
+    def readMediaItem(self, path, size, mtime):
+        # duration and a thumbnail, taken a little into the video so it is not a black title frame
+        item = MediaItem(path, size, mtime)
+        cap  = cv2.VideoCapture(path)
+        try:
+            if not cap.isOpened():
+                return item
+            frameCount = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+            fps        = cap.get(cv2.CAP_PROP_FPS)
+            if frameCount > 0 and fps > 0:
+                item.duration = round(frameCount / fps, 2)
+                cap.set(cv2.CAP_PROP_POS_FRAMES, int(frameCount * THUMBNAIL_POSITION))
+
+            success, frame = cap.read()
+            if success:
+                height, width = frame.shape[:2]
+                thumbnail = cv2.resize(frame, (THUMBNAIL_WIDTH, max(1, height * THUMBNAIL_WIDTH // width)),
+                                       interpolation=cv2.INTER_AREA)
+                thumbnailPath = os.path.join(self.thumbnailDir, hashlib.sha1(path.encode("utf-8")).hexdigest() + ".jpg")
+                if cv2.imwrite(thumbnailPath, thumbnail, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY]):
+                    item.thumbnail = thumbnailPath
+        except cv2.error as e:
+            logger.warning("Cannot read %s : %s", path, e)
+        finally:
+            cap.release()
+        return item
@@ -5,21 +5,63 @@ Created on Mon Dec 20 11:26:59 2021
 @author: memek
 """
 
-import cv2
+import os
 import sys
-from PyQt5.QtWidgets import QApplication, QWidget, QGroupBox, QPushButton, QHBoxLayout, QVBoxLayout, QLabel, QSlider, QStyle, QSizePolicy, QFileDialog, QMessageBox
+import time
+import logging
+import argparse
+import queue
+import threading
+import itertools
+import concurrent.futures
+from PyQt5.QtWidgets import QApplication, QWidget, QGroupBox, QPushButton, QHBoxLayout, QVBoxLayout, QLabel, QSlider, QStyle, QSizePolicy, QFileDialog, QMessageBox, QCheckBox, QListWidget, QListWidgetItem
 from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
 from PyQt5.QtMultimediaWidgets import QVideoWidget
 from PyQt5.QtGui import QIcon, QPalette, QFont
-from PyQt5.QtCore import Qt, QUrl
+from PyQt5.QtCore import Qt, QUrl, QSize
 from PyQt5 import QtCore, QtGui, QtWidgets
-from HandDetector import HandDetector
+from StageMetrics import StageMetrics, MetricsExporter
+from GestureEvents import GestureEventEngine, EVENT_START, EVENT_HOLD
+from HandPolicies import HAND_POLICIES, HAND_POLICY_LARGEST
+
+# Imported by importGestureModules off the GUI thread : numpy, cv2 and mediapipe take most of the start up time
+cv2               = None
+HandDetector      = None
+loadGestureRules  = None
+DEFAULT_GESTURE_TABLE = None
+GestureRules      = None
+GesturePipeline   = None
+MotionGate        = None
+QualityController = None
+LandmarkRecorder  = None
+LandmarkReplay    = None
+DynamicGestures   = None
+MultiCameraPipeline = None
+openCamera        = None
+drawHands         = None
+MediaLibrary      = None
 
 # Constants
 CAP_FRAME_HEIGHT    = 400
 CAP_FRAME_WIDTH     = 400
+SEARCH_FRAME_SIZE   = 320
+DETECTION_CON       = 0.7
+TARGET_FPS          = 30
+P95_LATENCY_BUDGET  = 40    # ms
+METRICS_FILE_ENV    = "GESTURE_METRICS_FILE"    # .prom for Prometheus text, anything else for CSV
+OVERLAY_LINE_HEIGHT = 14
+OVERLAY_FONT_SCALE  = 0.4
 MIN_VOLUME_VALUE    = 0
 MAX_VOLUME_VALUE    = 100
+VOLUME_RATE         = 30    # volume units per second while a volume gesture is held
+GESTURE_AGREE       = 3     # frames out of ...
+GESTURE_WINDOW      = 5     # ... the last frames which must agree before a gesture starts
+SEEK_STEP_MS        = 10000 # position change of one swipe
+VOLUME_PER_DEGREE   = 0.5   # volume units per degree of wrist rotation
+REPLAY_CHUNK_FRAMES = 500   # recorded frames replayed per event loop turn
+SKIP_HOLD_SECONDS   = 1.0   # next / previous only skip once their pose is held this long
+PLAYLIST_WIDTH      = 320
+THUMBNAIL_ICON_SIZE = QSize(64, 36)
 
 GESTURE_ACTION_PREFIX      = "Gesture Action : "
 GESTURE_ACTION_PLAY        = "Play"
@@ -28,14 +70,75 @@ GESTURE_ACTION_VOLUME_UP   = "Volume Up"
 GESTURE_ACTION_VOLUME_DOWN = "Volume Down"
 GESTURE_ACTION_VOLUME_MUTE = "Volume Mute"
 GESTURE_ACTION_VOLUME_MAX  = "Volume Maximum !"
+GESTURE_ACTION_SEEK_FWD    = "Seek Forward"
+GESTURE_ACTION_SEEK_BACK   = "Seek Backward"
+GESTURE_ACTION_NEXT        = "Next"
+GESTURE_ACTION_PREVIOUS    = "Previous"
 GESTURE_ACTION_IGNORE      = "Ignore"
 GESTURE_ACTION_NO_HAND     = "No Hands !!"
-FILE_SEPERATOR             = "/"
+GESTURE_ACTION_WARMING_UP  = "Warming up ..."
+GESTURE_ACTION_NO_CAMERA   = "Camera not available !"
+WARMING_UP_TEXT            = "Opening camera and loading hand model ..."
+
+logger = logging.getLogger(__name__)
+
+
+def importGestureModules():
+    global cv2, HandDetector, loadGestureRules, DEFAULT_GESTURE_TABLE, GestureRules, GesturePipeline, MotionGate, QualityController
+    global LandmarkRecorder, LandmarkReplay, DynamicGestures, MultiCameraPipeline, openCamera, drawHands
+    import cv2
+    import GestureRules
+    from HandDetector import HandDetector, loadGestureRules, DEFAULT_GESTURE_TABLE
+    from GesturePipeline import GesturePipeline
+    from MotionGate import MotionGate
+    from QualityController import QualityController
+    from LandmarkRecording import LandmarkRecorder, LandmarkReplay
+    import DynamicGestures
+    from MultiCamera import MultiCameraPipeline
+    from CameraCapture import openCamera
+    from HandOverlay import drawHands
+
+
+def importLibraryModules():
+    # only cv2, the playlist fills up without waiting for mediapipe
+    global MediaLibrary
+    from MediaLibrary import MediaLibrary
+
 
 class MediaPlayer(QWidget):
     
-    def __init__(self):
+    warmedUp     = QtCore.pyqtSignal(object, object, object)
+    warmUpFailed = QtCore.pyqtSignal(str)
+    libraryItemsFound = QtCore.pyqtSignal(object)
+    
+    def __init__(self, startTime=None, cameraSources=None, metricsFile=None, handPolicy=HAND_POLICY_LARGEST, gestureFile=None,
+                 recordFile=None, replayFile=None, fallbackVideo=None, libraryDirs=None):
         super().__init__()
+        
+        #startup is measured from startTime, main() passes the moment it was entered
+        self.startTime        = time.monotonic() if startTime is None else startTime
+        self.cameraSources    = list(cameraSources) if cameraSources else [0]
+        self.metricsFile      = metricsFile
+        self.handPolicy       = handPolicy
+        self.gestureFile      = gestureFile
+        self.recordFile       = recordFile
+        self.replayFile       = replayFile
+        self.fallbackVideo    = fallbackVideo
+        self.firstFrameTime   = None
+        self.firstGestureTime = None
+        self.closing          = False
+        
+        #gestures start once they are stable, continuous actions follow the capture clock
+        self.gestureEvents    = GestureEventEngine(GESTURE_AGREE, GESTURE_WINDOW)
+        self.gestureLabelText = None
+        self.volumeLevel      = float(MAX_VOLUME_VALUE)
+        self.dynamicGestures  = None
+        self.gestureSource    = 0
+        
+        #media folders are indexed in the background, one scan at a time
+        self.mediaLibrary     = None
+        self.libraryQueue     = queue.Queue()
+        self.playlistItems    = {}
 
         self.setWindowTitle("Gesture Based Media Player")
         self.setGeometry(350, 100, 1300, 500)
@@ -46,14 +149,36 @@ class MediaPlayer(QWidget):
         self.setPalette(p)
         self.initUi()
         self.show()        
+        logger.info("Window shown %.0f ms after start", self.elapsedMs())
+        
+        #the camera and the hand model are opened in the background, the pipeline starts when both are ready
+        self.warmedUp.connect(self.onWarmedUp)
+        self.warmUpFailed.connect(self.onWarmUpFailed)
+        threading.Thread(target=self.warmUp, name="WarmUp", daemon=True).start()
+        self.libraryItemsFound.connect(self.addLibraryItems)
+        threading.Thread(target=self.libraryWorker, name="MediaLibrary", daemon=True).start()
+        if libraryDirs:
+            self.scanLibrary(libraryDirs)
 
 
     def initUi(self):
         #create media player object
         self.mediaPlayer = QMediaPlayer(None, QMediaPlayer.VideoSurface)
         
-        #create HandDetector object
-        self.handDetector = HandDetector(detectionCon=0.7)
+        #create stage timers, exported periodically when a metrics file is configured
+        self.stageMetrics    = StageMetrics()
+        self.metricsExporter = None
+        if self.metricsFile:
+            self.metricsExporter = MetricsExporter(self.stageMetrics, self.metricsFile)
+            self.metricsExporter.start()
+        
+        #camera, hand detector and gesture pipeline are created by onWarmedUp
+        self.caps              = []
+        self.handDetector      = None
+        self.gestureRules      = None
+        self.qualityController = None
+        self.gesturePipeline   = None
+        self.landmarkRecorder  = None
 
         #create videoWidget object
         videoWidget = QVideoWidget()        
@@ -61,20 +186,24 @@ class MediaPlayer(QWidget):
         #create open button
         openBtn = QPushButton('Open Media')
         openBtn.clicked.connect(self.openFile)
-
-        #create camera for capturing frames
-        self.cap = cv2.VideoCapture(0)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAP_FRAME_HEIGHT)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH,  CAP_FRAME_WIDTH)
         
-        #create timer for period of capturing frames 
-        self.timer = QtCore.QTimer(self, interval=2)
-        self.timer.timeout.connect(self.updateFrame)
-        self.timer.start()
-       
+        #create open folder button, its media files are added to the playlist
+        openFolderBtn = QPushButton('Open Folder')
+        openFolderBtn.clicked.connect(self.openFolder)
+        
+        #create playlist, filled while the folders are scanned
+        self.playlist = QListWidget()
+        self.playlist.setSortingEnabled(True)
+        self.playlist.setIconSize(THUMBNAIL_ICON_SIZE)
+        self.playlist.setMaximumWidth(PLAYLIST_WIDTH)
+        self.playlist.setStyleSheet("color:white; background-color:black")
+        self.playlist.itemActivated.connect(self.playItem)
+
         #create image_label for showing captured image
         self.cameraImage = QtWidgets.QLabel(self)
-        self.cameraImage.setText("")
+        self.cameraImage.setText(WARMING_UP_TEXT)
+        self.cameraImage.setAlignment(Qt.AlignCenter)
+        self.cameraImage.setStyleSheet("color:white")
         self.cameraImage.setScaledContents(True)
         self.cameraImage.setObjectName("cameraImage")
                     
@@ -101,6 +230,15 @@ class MediaPlayer(QWidget):
         self.volumeSlider.setRange(MIN_VOLUME_VALUE, MAX_VOLUME_VALUE)
         self.volumeSlider.setValue(MAX_VOLUME_VALUE)
         self.volumeSlider.setGeometry(10, 450, 200, 35)
+        
+        #create check box for showing stage timings on the camera image
+        self.metricsCheckBox = QCheckBox("Metrics")
+        self.metricsCheckBox.setStyleSheet("color:white")
+        
+        #create check box for drawing the detected hands on the camera image
+        self.landmarksCheckBox = QCheckBox("Landmarks")
+        self.landmarksCheckBox.setStyleSheet("color:white")
+        self.landmarksCheckBox.setChecked(True)
 
         #create label for errors
         self.mediaNameLabel = QLabel()
@@ -113,7 +251,7 @@ class MediaPlayer(QWidget):
         self.gestureResultLabel = QLabel()
         self.gestureResultLabel.setFont(QFont('Arial', 20))
         self.gestureResultLabel.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Maximum)
-        self.gestureResultLabel.setText("Action")
+        self.gestureResultLabel.setText(GESTURE_ACTION_WARMING_UP)
         self.gestureResultLabel.setStyleSheet("color:white")
         
         #create main layout
@@ -126,6 +264,8 @@ class MediaPlayer(QWidget):
         #set widgets to the hbox layout        
         vbLeftBottomLayout.addWidget(volumeLabel)
         vbLeftBottomLayout.addWidget(self.volumeSlider)        
+        vbLeftBottomLayout.addWidget(self.landmarksCheckBox)
+        vbLeftBottomLayout.addWidget(self.metricsCheckBox)
         
         # create groupbox for gesture detection (camera output)
         cameraGroupBox = QGroupBox()    
@@ -143,6 +283,7 @@ class MediaPlayer(QWidget):
 
         #add widgets to the hbox layout
         hbRightBottomLayout.addWidget(openBtn)
+        hbRightBottomLayout.addWidget(openFolderBtn)
         hbRightBottomLayout.addWidget(self.playBtn)
         hbRightBottomLayout.addWidget(self.slider)
 
@@ -161,6 +302,9 @@ class MediaPlayer(QWidget):
         
         #add mediaPlayerGroupBox to mainLayout
         mainLayout.addWidget(mediaPlayerGroupBox)
+        
+        #add playlist to mainLayout
+        mainLayout.addWidget(self.playlist)
 
         self.setLayout(mainLayout)
         self.mediaPlayer.setVideoOutput(videoWidget)
@@ -169,6 +313,160 @@ class MediaPlayer(QWidget):
         self.mediaPlayer.stateChanged.connect(self.mediaStateChanged)
         self.mediaPlayer.positionChanged.connect(self.positionChanged)
         self.mediaPlayer.durationChanged.connect(self.durationChanged)
+        self.mediaPlayer.mediaStatusChanged.connect(self.mediaStatusChanged)
+
+    def warmUp(self):
+        # runs off the GUI thread
+        try:
+            importGestureModules()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.cameraSources) + 1) as executor:
+                # a replayed recording needs no camera
+                #cameras grab in their own thread and only hand out the newest frame
+                capFutures     = [executor.submit(openCamera, source, CAP_FRAME_WIDTH, CAP_FRAME_HEIGHT, TARGET_FPS,
+                                                  self.stageMetrics, self.fallbackVideo)
+                                  for source in self.cameraSources if not self.replayFile]
+                #several cameras get their detectors in the inference processes, only the rules are needed here
+                if self.isMultiCamera():
+                    rulesFuture = executor.submit(self.loadGestures)
+                    caps, handDetector = [future.result() for future in capFutures], None
+                    gestureRules = rulesFuture.result()
+                else:
+                    detectorFuture = executor.submit(self.loadHandDetector)
+                    caps, handDetector = [future.result() for future in capFutures], detectorFuture.result()
+                    gestureRules = handDetector.gestureRules
+        except Exception as e:
+            logger.exception("Warm up failed")
+            self.warmUpFailed.emit(str(e))
+            return
+        
+        self.warmedUp.emit(caps, handDetector, gestureRules)
+        
+    def isMultiCamera(self):
+        return len(self.cameraSources) > 1 and not self.replayFile
+        
+    def loadGestures(self):
+        #gestures from the config file come before the built in ones
+        return loadGestureRules(self.gestureFile) if self.gestureFile else DEFAULT_GESTURE_TABLE
+        
+    def loadHandDetector(self):
+        #create HandDetector object, skipping inference while the camera image doesn't change
+        #and tracking the hand in a cropped region once it is found
+        #gestures from the config file come before the built in ones
+        #a replayed recording only needs the classifier, not the model
+        startTime = time.monotonic()
+        gestureRules = loadGestureRules(self.gestureFile) if self.gestureFile else None
+        handDetector = HandDetector(detectionCon=DETECTION_CON, motionGate=MotionGate(),
+                                    roiTracking=True, searchSize=SEARCH_FRAME_SIZE, metrics=self.stageMetrics,
+                                    handPolicy=self.handPolicy, gestureRules=gestureRules,
+                                    loadModel=not self.replayFile)
+        logger.info("Hand detector created in %.0f ms", (time.monotonic() - startTime) * 1000.0)
+        return handDetector
+        
+    def onWarmedUp(self, caps, handDetector, gestureRules):
+        self.caps         = caps
+        self.handDetector = handDetector
+        self.gestureRules = gestureRules
+        if self.closing:
+            for cap in self.caps:
+                cap.release()
+            return
+        
+        if self.replayFile:
+            self.bindGestureActions(self.gestureRules)
+            self.replayLandmarks()
+            return
+        
+        #sources which could not be opened are left out
+        sources = [source for source, cap in zip(self.cameraSources, self.caps) if cap.isOpened()]
+        for cap in self.caps:
+            if not cap.isOpened():
+                cap.release()
+        self.caps = [cap for cap in self.caps if cap.isOpened()]
+        if not self.caps:
+            self.cameraImage.setText(GESTURE_ACTION_NO_CAMERA)
+            self.setGestureLabel(GESTURE_ACTION_NO_CAMERA)
+            return
+        
+        self.bindGestureActions(self.gestureRules)
+        
+        #create pipeline for capturing frames and detecting gestures off the GUI thread
+        #model complexity, input size and inference rate follow the measured inference latency
+        #every classified frame is appended to the landmark recording when one is requested
+        if self.recordFile:
+            self.landmarkRecorder = (LandmarkRecorder(self.recordFile, self.handDetector.maxHands)
+                                     if self.handDetector is not None else LandmarkRecorder(self.recordFile))
+        #several cameras get an inference process each, their gestures are fused into one stream,
+        #even when only one of them could be opened
+        if self.handDetector is not None:
+            self.qualityController = QualityController(TARGET_FPS, P95_LATENCY_BUDGET)
+            self.gesturePipeline = GesturePipeline(self.caps[0], self.handDetector, self, self.qualityController,
+                                                   self.stageMetrics, self.landmarkRecorder)
+        else:
+            self.gesturePipeline = MultiCameraPipeline(sources, self.caps, self.gestureRules,
+                                                       self.inferenceOptions(), self, self.stageMetrics,
+                                                       self.landmarkRecorder)
+        self.gesturePipeline.resultReady.connect(self.updateFrame)
+        self.gesturePipeline.failed.connect(self.onPipelineFailed)
+        self.gesturePipeline.start()
+        logger.info("Warmed up %.0f ms after start", self.elapsedMs())
+        
+    def replayLandmarks(self):
+        # recorded landmarks through the detector and the gesture actions, as fast as they go
+        # the actions touch the widgets, so the replay runs on the GUI thread in chunks which keep the window responsive
+        self.replay       = LandmarkReplay(self.replayFile)
+        self.replayFrames = self.replay.replay(self.handDetector)
+        self.replayStart  = time.perf_counter()
+        self.replayed     = 0
+        self.gestureEvents.reset()
+        self.dynamicGestures.reset()
+        self.replayTimer  = QtCore.QTimer(self)
+        self.replayTimer.timeout.connect(self.replayChunk)
+        self.replayTimer.start(0)
+        
+    def replayChunk(self):
+        handDetector = self.handDetector
+        frames       = 0
+        for record, gestureId in itertools.islice(self.replayFrames, REPLAY_CHUNK_FRAMES):
+            captureTime = float(record["captureTime"])
+            self.dispatchGesture(gestureId, captureTime)
+            self.dispatchDynamicGestures(handDetector.handLandmarks, handDetector.handDirections,
+                                         handDetector.controlIndex, gestureId, int(record["imageSize"][1]),
+                                         captureTime)
+            frames += 1
+        self.replayed += frames
+        if frames == REPLAY_CHUNK_FRAMES and not self.closing:
+            self.cameraImage.setText("Replaying frame %d of %d" % (self.replayed, len(self.replay)))
+            return
+        
+        self.replayTimer.stop()
+        elapsed = time.perf_counter() - self.replayStart
+        logger.info("Replayed %d frames of %s in %.2f s", self.replayed, self.replayFile, elapsed)
+        self.cameraImage.setText("Replayed %d frames in %.2f s" % (self.replayed, elapsed))
+        
+    def inferenceOptions(self):
+        # the settings of loadHandDetector, for the detectors of the inference processes
+        return {"detectionCon": DETECTION_CON, "searchSize": SEARCH_FRAME_SIZE, "handPolicy": self.handPolicy,
+                "gestureFile": self.gestureFile, "targetFps": TARGET_FPS, "p95Budget": P95_LATENCY_BUDGET}
+        
+    def onWarmUpFailed(self, message):
+        self.cameraImage.setText(message)
+        self.setGestureLabel(GESTURE_ACTION_NO_CAMERA)
+        
+    def onPipelineFailed(self, message):
+        # the camera view would freeze on its last frame otherwise
+        self.cameraImage.setText(message)
+        self.setGestureLabel(GESTURE_ACTION_NO_CAMERA)
+        
+    def elapsedMs(self):
+        return (time.monotonic() - self.startTime) * 1000.0
+        
+    def reportStartup(self, packet):
+        if self.firstFrameTime is None:
+            self.firstFrameTime = self.elapsedMs()
+            logger.info("Time to first frame : %.0f ms", self.firstFrameTime)
+        if self.firstGestureTime is None and packet.gestureId != self.gestureRules.noHandId:
+            self.firstGestureTime = self.elapsedMs()
+            logger.info("Time to first gesture : %.0f ms", self.firstGestureTime)
 
     def closeEvent(self, event):
         reply = QMessageBox.question(self, 'Quit?',
@@ -177,6 +475,7 @@ class MediaPlayer(QWidget):
 
         if reply == QMessageBox.Yes:
             if not type(event) == bool:
+                self.stopWorkers()
                 event.accept()
             else:
                 self.closeApplication()
@@ -189,9 +488,82 @@ class MediaPlayer(QWidget):
         filename, _ = QFileDialog.getOpenFileName(self, "Open Media")
 
         if filename != '':
-            self.mediaPlayer.setMedia(QMediaContent(QUrl.fromLocalFile(filename)))
-            self.playBtn.setEnabled(True)
-            self.mediaNameLabel.setText(self.getLocalFileName(filename))            
+            self.openMedia(filename)
+
+    def openMedia(self, filename):
+        self.mediaPlayer.setMedia(QMediaContent(QUrl.fromLocalFile(filename)))
+        self.playBtn.setEnabled(True)
+        self.mediaNameLabel.setText(self.getLocalFileName(filename))
+
+    def openFolder(self):
+        directory = QFileDialog.getExistingDirectory(self, "Open Folder")
+
+        if directory != '':
+            self.scanLibrary([directory])
+
+    def scanLibrary(self, directories):
+        self.libraryQueue.put(list(directories))
+
+    def libraryWorker(self):
+        # runs off the GUI thread and owns the library, folders are scanned one after the other
+        # the items reach addLibraryItems in batches while the scan goes on
+        while True:
+            directories = self.libraryQueue.get()
+            try:
+                if self.mediaLibrary is None:
+                    importLibraryModules()
+                    self.mediaLibrary = MediaLibrary()
+                self.mediaLibrary.scan(directories, self.emitLibraryItems)
+            except Exception:
+                logger.exception("Scanning %s failed", ", ".join(directories))
+
+    def emitLibraryItems(self, items):
+        # thumbnails are decoded and scaled here in the scan thread, the GUI thread only wraps them in icons
+        thumbnails = []
+        for item in items:
+            image = QtGui.QImage(item.thumbnail) if item.thumbnail is not None else None
+            if image is not None and not image.isNull():
+                image = image.scaled(THUMBNAIL_ICON_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            thumbnails.append(image)
+        self.libraryItemsFound.emit(list(zip(items, thumbnails)))
+
+    def addLibraryItems(self, items):
+        # (MediaItem, QImage or None) pairs, items scanned again replace their entry
+        self.playlist.setUpdatesEnabled(False)
+        for item, thumbnail in items:
+            listItem = self.playlistItems.get(item.path)
+            if listItem is None:
+                listItem = QListWidgetItem()
+                listItem.setData(Qt.UserRole, item.path)
+                self.playlistItems[item.path] = listItem
+                self.playlist.addItem(listItem)
+            listItem.setText(self.getPlaylistText(item))
+            if thumbnail is not None and not thumbnail.isNull():
+                listItem.setIcon(QIcon(QtGui.QPixmap.fromImage(thumbnail)))
+        self.playlist.setUpdatesEnabled(True)
+
+    def getPlaylistText(self, item):
+        if item.duration is None:
+            return item.name()
+        minutes, seconds = divmod(int(round(item.duration)), 60)
+        hours, minutes = divmod(minutes, 60)
+        duration = "%d:%02d:%02d" % (hours, minutes, seconds) if hours else "%d:%02d" % (minutes, seconds)
+        return "%s (%s)" % (item.name(), duration)
+
+    def playItem(self, listItem):
+        self.playlist.setCurrentItem(listItem)
+        self.openMedia(listItem.data(Qt.UserRole))
+        self.playMedia()
+
+    def playNext(self):
+        # wraps around, the first item when nothing was played from the playlist yet
+        if self.playlist.count() > 0:
+            self.playItem(self.playlist.item((self.playlist.currentRow() + 1) % self.playlist.count()))
+
+    def playPrevious(self):
+        if self.playlist.count() > 0:
+            row = max(self.playlist.currentRow(), 0)
+            self.playItem(self.playlist.item((row - 1) % self.playlist.count()))
 
     def onPlayButonClick(self):
         if self.mediaPlayer.state() == QMediaPlayer.PlayingState:
@@ -207,31 +579,37 @@ class MediaPlayer(QWidget):
             self.mediaPlayer.pause()
             
     def changeVolume(self, value):
+        # slider moved by hand or by a gesture
+        if int(round(self.volumeLevel)) != value:
+            self.volumeLevel = float(value)
         self.mediaPlayer.setVolume(value)
         
-    def volumeUp(self):
-        currentVolume = self.volumeSlider.value()
-        currentVolume = currentVolume + 1
-        if currentVolume > MAX_VOLUME_VALUE:
-            currentVolume = MAX_VOLUME_VALUE
+    def volumeUp(self, step=1):
+        self.adjustVolume(step)
+        
+    def volumeDown(self, step=1):
+        self.adjustVolume(-step)
+        
+    def adjustVolume(self, step):
+        # fractional steps add up, the slider (and the player through valueChanged) only sees whole units
+        self.volumeLevel = min(max(self.volumeLevel + step, MIN_VOLUME_VALUE), MAX_VOLUME_VALUE)
+        if self.volumeLevel == MAX_VOLUME_VALUE and step > 0:
             self.setGestureLabel(GESTURE_ACTION_VOLUME_MAX)
-            
-        self.volumeSlider.setValue(currentVolume)
-        self.changeVolume(currentVolume)
-        
-    def volumeDown(self):
-        currentVolume = self.volumeSlider.value()
-        currentVolume = currentVolume - 1
-        if currentVolume < MIN_VOLUME_VALUE:
-            currentVolume = MIN_VOLUME_VALUE
+        elif self.volumeLevel == MIN_VOLUME_VALUE and step < 0:
             self.setGestureLabel(GESTURE_ACTION_VOLUME_MUTE)
             
-        self.volumeSlider.setValue(currentVolume)
-        self.changeVolume(currentVolume)
+        currentVolume = int(round(self.volumeLevel))
+        if currentVolume != self.volumeSlider.value():
+            self.volumeSlider.setValue(currentVolume)
+        
+    def rotateVolume(self, degrees):
+        # clockwise on screen turns the volume up, like a knob
+        self.setGestureLabel(GESTURE_ACTION_VOLUME_UP if degrees > 0 else GESTURE_ACTION_VOLUME_DOWN)
+        self.adjustVolume(VOLUME_PER_DEGREE * degrees)
         
     def volumeMute(self):        
-        self.volumeSlider.setValue(0)
-        self.changeVolume(0)
+        self.volumeLevel = float(MIN_VOLUME_VALUE)
+        self.volumeSlider.setValue(MIN_VOLUME_VALUE)
 
     def mediaStateChanged(self, state):
         if self.mediaPlayer.state() == QMediaPlayer.PlayingState:
@@ -239,6 +617,11 @@ class MediaPlayer(QWidget):
         else:
             self.playBtn.setIcon(self.style().standardIcon(QStyle.SP_MediaPlay))
 
+    def mediaStatusChanged(self, status):
+        # the playlist goes on with the next item
+        if status == QMediaPlayer.EndOfMedia and self.playlist.currentRow() >= 0:
+            self.playNext()
+
     def positionChanged(self, position):
         self.slider.setValue(position)
 
@@ -248,78 +631,176 @@ class MediaPlayer(QWidget):
     def setPosition(self, position):
         self.mediaPlayer.setPosition(position)
         
+    def seek(self, offset):
+        position = min(max(self.mediaPlayer.position() + offset, 0), self.mediaPlayer.duration())
+        self.setPosition(position)
+        
     def setGestureLabel(self, actionText):
-        gestureAction = GESTURE_ACTION_PREFIX + actionText
-        self.gestureResultLabel.setText(gestureAction)
+        if actionText != self.gestureLabelText:
+            self.gestureLabelText = actionText
+            self.gestureResultLabel.setText(GESTURE_ACTION_PREFIX + actionText)
+        
+    def recordStage(self, stage, startTime):
+        endTime = time.perf_counter()
+        self.stageMetrics.record(stage, endTime - startTime)
+        return endTime
         
-    def detectAndDisplayImage(self, img):        
-        if img is not None:
-            detectedImg = self.detectHandPosition(img)
-            self.displayImage(detectedImg)
+    def detectAndDisplayImage(self, packet):        
+        if packet.image is not None:
+            startTime = time.perf_counter()
+            if packet.sourceIndex != self.gestureSource:
+                # another camera took over, its hand positions don't continue the previous ones
+                self.gestureSource = packet.sourceIndex
+                self.dynamicGestures.reset()
+            self.dispatchGesture(packet.gestureId, packet.captureTime)
+            self.dispatchDynamicGestures(packet.handLandmarks, packet.handDirections, packet.controlIndex,
+                                         packet.gestureId, packet.image.shape[1], packet.captureTime)
+            startTime = self.recordStage("action", startTime)
+            
+            #inference is done with the frame, the overlays only go on what is displayed
+            if self.landmarksCheckBox.isChecked() and packet.controlIndex >= 0:
+                drawHands(packet.image, packet.handLandmarks, packet.handBoxes, packet.controlIndex)
+                startTime = self.recordStage("drawHands", startTime)
+                
+            if self.metricsCheckBox.isChecked():
+                self.drawMetricsOverlay(packet.image)
+                startTime = self.recordStage("overlay", startTime)
+                
+            self.displayImage(packet.image)
+            self.recordStage("display", startTime)
+            self.stageMetrics.record("latency", time.monotonic() - packet.captureTime)
         else:
             print("Image is null !")
+            
+    def drawMetricsOverlay(self, img):
+        # p50 / p95 of every stage, drawn on the frame which is about to be displayed
+        for lineNo, line in enumerate(self.stageMetrics.overlayLines()):
+            cv2.putText(img, line, (5, (lineNo + 1) * OVERLAY_LINE_HEIGHT), cv2.FONT_HERSHEY_SIMPLEX,
+                        OVERLAY_FONT_SCALE, (0, 255, 255), 1, cv2.LINE_AA)
         
-    def detectHandPosition(self, img):
-        outImage     = self.handDetector.detectHands(img)
-        handPosition = self.handDetector.getHandPosition()        
-        
-        if handPosition == HandDetector.HAND_POSITION_CLOSE:
-            self.setGestureLabel(GESTURE_ACTION_PLAY)
-            self.playMedia()
-        elif handPosition == HandDetector.HAND_POSITION_OPEN:
-            self.stopMedia()
-            self.setGestureLabel(GESTURE_ACTION_STOP)
-        elif handPosition == HandDetector.HAND_POSITION_THUMB_UP:
-            self.setGestureLabel(GESTURE_ACTION_VOLUME_UP)
-            self.volumeUp()
-        elif handPosition == HandDetector.HAND_POSITION_THUMB_DOWN:
-            self.setGestureLabel(GESTURE_ACTION_VOLUME_DOWN)
-            self.volumeDown()
-        elif handPosition == HandDetector.HAND_POSITION_VICTORY:
-            self.setGestureLabel(GESTURE_ACTION_VOLUME_MUTE)
-            self.volumeMute()                        
-        elif handPosition == HandDetector.HAND_POSITION_NO_HAND:
-            self.setGestureLabel(GESTURE_ACTION_NO_HAND)
-        elif handPosition == HandDetector.HAND_POSITION_IGNORE:          
-            self.setGestureLabel(GESTURE_ACTION_IGNORE)     
-                
-        return outImage        
+    def bindGestureActions(self, gestureRules):
+        #gesture actions as (label, called on start, called with every HOLD event), indexed by gesture id
+        actionHandlers = {
+            GestureRules.ACTION_PLAY        : (GESTURE_ACTION_PLAY,        self.playMedia,  None),
+            GestureRules.ACTION_STOP        : (GESTURE_ACTION_STOP,        self.stopMedia,  None),
+            GestureRules.ACTION_VOLUME_UP   : (GESTURE_ACTION_VOLUME_UP,   None,
+                                               lambda event: self.volumeUp(VOLUME_RATE * event.elapsed)),
+            GestureRules.ACTION_VOLUME_DOWN : (GESTURE_ACTION_VOLUME_DOWN, None,
+                                               lambda event: self.volumeDown(VOLUME_RATE * event.elapsed)),
+            GestureRules.ACTION_VOLUME_MUTE : (GESTURE_ACTION_VOLUME_MUTE, self.volumeMute, None),
+            GestureRules.ACTION_NEXT        : (GESTURE_ACTION_NEXT,        None,
+                                               lambda event: self.skipWhenHeld(event, self.playNext)),
+            GestureRules.ACTION_PREVIOUS    : (GESTURE_ACTION_PREVIOUS,    None,
+                                               lambda event: self.skipWhenHeld(event, self.playPrevious)),
+            GestureRules.ACTION_IGNORE      : (GESTURE_ACTION_IGNORE,      None,            None),
+            GestureRules.ACTION_NO_HAND     : (GESTURE_ACTION_NO_HAND,     None,            None),
+        }
+        self.gestureActions = [actionHandlers[action] for action in gestureRules.actions]
+        
+        #movements of the controlling hand over the last frames, as (label, handler called with the value)
+        self.dynamicGestures = DynamicGestures.DynamicGestureDetector()
+        self.openHandId      = gestureRules.openHandId
+        self.dynamicActions  = {
+            DynamicGestures.DYNAMIC_SWIPE_RIGHT : (GESTURE_ACTION_SEEK_FWD,  lambda velocity: self.seek(SEEK_STEP_MS)),
+            DynamicGestures.DYNAMIC_SWIPE_LEFT  : (GESTURE_ACTION_SEEK_BACK, lambda velocity: self.seek(-SEEK_STEP_MS)),
+            DynamicGestures.DYNAMIC_ROTATE      : (None,                     self.rotateVolume),
+        }
         
+    def skipWhenHeld(self, event, skip):
+        # once per gesture, pointing at something or passing through the pose does not skip a track
+        if event.duration >= SKIP_HOLD_SECONDS > event.duration - event.elapsed:
+            skip()
+        
+    def dispatchGesture(self, gestureId, captureTime):
+        # actions run on the START and HOLD events of stable gestures, not on every frame
+        for event in self.gestureEvents.update(gestureId, captureTime):
+            actionText, onStart, onHold = self.gestureActions[event.gestureId]
+            if event.eventType == EVENT_START:
+                self.setGestureLabel(actionText)
+                if onStart is not None:
+                    onStart()
+            elif event.eventType == EVENT_HOLD and onHold is not None:
+                onHold(event)
+        
+    def dispatchDynamicGestures(self, handLandmarks, handDirections, controlIndex, gestureId, imageWidth, captureTime):
+        # the window starts over when another hand takes control, rotation only follows the open hand
+        landmarks = handLandmarks[controlIndex] if controlIndex >= 0 else None
+        hand      = (controlIndex, handDirections[controlIndex]) if controlIndex >= 0 else None
+        canRotate = gestureId == self.openHandId
+        for gesture in self.dynamicGestures.update(landmarks, imageWidth, captureTime, hand, canRotate):
+            actionText, handler = self.dynamicActions[gesture.name]
+            if actionText is not None:
+                self.setGestureLabel(actionText)
+            handler(gesture.value)
+            
     def displayImage(self, img):
-        qformat = QtGui.QImage.Format_Indexed8
+        # wrap the BGR frame as it is; QPixmap.fromImage makes the only copy
+        qformat = QtGui.QImage.Format_Grayscale8
         if len(img.shape)==3 :
             if img.shape[2]==4:
-                qformat = QtGui.QImage.Format_RGBA8888
+                qformat = QtGui.QImage.Format_ARGB32
             else:
-                qformat = QtGui.QImage.Format_RGB888
+                qformat = QtGui.QImage.Format_BGR888
                 
-        outImage = QtGui.QImage(img, img.shape[1], img.shape[0], img.strides[0], qformat)
-        outImage = outImage.rgbSwapped()       
+        outImage = QtGui.QImage(img.data, img.shape[1], img.shape[0], img.strides[0], qformat)
         self.cameraImage.setPixmap(QtGui.QPixmap.fromImage(outImage))   
             
     @QtCore.pyqtSlot()
     def updateFrame(self):
-        success, image = self.cap.read()
-        if success:
-            image = cv2.flip(image, 1)
-            self.detectAndDisplayImage(image)
+        packet = self.gesturePipeline.takeResult()
+        if packet is not None:
+            self.detectAndDisplayImage(packet)
+            self.reportStartup(packet)
+            packet.release()
             
-    def getLocalFileName(self, fileName):    
-        print(fileName)
-        seperatorLastIndex = fileName.rfind(FILE_SEPERATOR)
-        print(seperatorLastIndex)
-        if seperatorLastIndex > 0:
-            return fileName[seperatorLastIndex + 1:]
-        else:
-            return ''
+    def getLocalFileName(self, fileName):
+        return os.path.basename(fileName)
+        
+    def stopWorkers(self):
+        self.closing = True
+        if self.gesturePipeline is not None:
+            self.gesturePipeline.stop()
+        if self.landmarkRecorder is not None:
+            self.landmarkRecorder.close()
+            logger.info("Recorded %d frames to %s", self.landmarkRecorder.frames, self.recordFile)
+        if self.metricsExporter is not None:
+            self.metricsExporter.stop()
+            self.metricsExporter.join()
         
     def closeApplication(self):   
         self.stopMedia()
-        self.timer.stop()
-        self.cap.release()        
+        self.stopWorkers()
+        for cap in self.caps:
+            cap.release()        
         sys.exit()
         
         
-app  = QApplication(sys.argv)
-playerWindow = MediaPlayer()
-sys.exit(app.exec_())
\ No newline at end of file
+def main(argv=None):
+    startTime = time.monotonic()
+    argv = sys.argv if argv is None else argv
+    parser = argparse.ArgumentParser(description="Gesture based media player.")
+    parser.add_argument("--camera", action="append",
+                        help="camera device index or video file, repeat it for several cameras (default 0)")
+    parser.add_argument("--fallback-video", help="video file played instead of a camera which cannot be opened")
+    parser.add_argument("--metrics-file", default=os.environ.get(METRICS_FILE_ENV),
+                        help="export stage timings, Prometheus text for .prom files and CSV otherwise")
+    parser.add_argument("--hand-policy", default=HAND_POLICY_LARGEST, choices=HAND_POLICIES,
+                        help="hand controlling the player when several are visible : largest, dominant or center")
+    parser.add_argument("--gestures", help="JSON file with additional gesture rules")
+    parser.add_argument("--record", help="append the landmarks and gestures of every frame to this file")
+    parser.add_argument("--replay", help="run the gesture actions of a recording instead of the camera")
+    parser.add_argument("--library", action="append",
+                        help="media folder listed in the playlist, repeat it for several folders")
+    # everything else is left to Qt (-style, -platform ...)
+    args, qtArgs = parser.parse_known_args(argv[1:])
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    app = QApplication(argv[:1] + qtArgs)
+    # the window has no parent, the application holds it so it is not garbage collected while the loop runs
+    app.playerWindow = MediaPlayer(startTime, args.camera, args.metrics_file, args.hand_policy, args.gestures,
+                                   args.record, args.replay, args.fallback_video, args.library)
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
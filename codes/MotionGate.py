@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Cheap change detector used to skip hand inference on static camera frames.
+
+Frames are reduced to a tiny grayscale thumbnail and compared with the thumbnail
+of the last frame that went through inference. Inference is forced again after
+refreshInterval skipped frames so the hand state can not go stale.
+"""
+
+import cv2
+import numpy as np
+
+# Constants
+GATE_FRAME_WIDTH          = 32
+GATE_FRAME_HEIGHT         = 24
+DEFAULT_MOTION_THRESHOLD  = 3.0     # mean absolute gray level difference (0-255)
+DEFAULT_REFRESH_INTERVAL  = 15      # frames
+
+
+class MotionGate():
+
+    def __init__(self, threshold=DEFAULT_MOTION_THRESHOLD, refreshInterval=DEFAULT_REFRESH_INTERVAL):
+        self.threshold       = threshold
+        self.refreshInterval = refreshInterval
+        self.thumbnail       = np.empty((GATE_FRAME_HEIGHT, GATE_FRAME_WIDTH, 3), dtype=np.uint8)
+        self.gray            = np.empty((GATE_FRAME_HEIGHT, GATE_FRAME_WIDTH), dtype=np.uint8)
+        self.diff            = np.empty((GATE_FRAME_HEIGHT, GATE_FRAME_WIDTH), dtype=np.uint8)
+        self.reference       = None
+        self.skippedInARow   = 0
+        self.skippedFrames   = 0
+        self.checkedFrames   = 0
+
+    def isStatic(self, img):
+        self.checkedFrames += 1
+        cv2.resize(img, (GATE_FRAME_WIDTH, GATE_FRAME_HEIGHT), dst=self.thumbnail, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.thumbnail, cv2.COLOR_BGR2GRAY, dst=self.gray)
+
+        if self.reference is not None and self.skippedInARow < self.refreshInterval:
+            cv2.absdiff(self.gray, self.reference, dst=self.diff)
+            if cv2.mean(self.diff)[0] < self.threshold:
+                self.skippedInARow += 1
+                self.skippedFrames += 1
+                return True
+
+        # frame goes to inference and becomes the new reference
+        if self.reference is None:
+            self.reference = self.gray.copy()
+        else:
+            np.copyto(self.reference, self.gray)
+        self.skippedInARow = 0
+        return False
+
+    def reset(self):
+        self.reference     = None
+        self.skippedInARow = 0
+
+    def skipRatio(self):
+        if self.checkedFrames == 0:
+            return 0.0
+        return self.skippedFrames / self.checkedFrames
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""
+Several capture sources, each with its own inference process.
+
+Every source (a camera index, or a video file standing in for a camera) is read
+by a capture thread of the player process, which mirrors the frames straight
+into a SharedFrameRing : a few frame slots in multiprocessing.shared_memory.
+An inference process per source takes the newest frame of its ring, runs
+HandDetector and the gesture classifier on it and sends back only landmarks
+and gesture ids, so frames are never pickled and every source runs on its own
+core, outside of the player's GIL.
+
+The results are fused into one stream : the selected source keeps control
+while it sees a hand, another source takes over when it sees a hand and the
+selected one does not. Only results of the selected source reach the player,
+as the FramePackets GesturePipeline produces. An inference process which dies
+is reported through the failed signal, like a stage of GesturePipeline; the
+other sources go on.
+"""
+
+import math
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import cv2
+from PyQt5 import QtCore
+from HandDetector import HandDetector, HandClassifier, loadGestureRules
+from GesturePipeline import FramePacket, ResultSlot, STAGE_POLL_TIMEOUT, CAPTURE_RETRY_DELAY
+from FrameBuffers import FramePool
+from MotionGate import MotionGate
+from QualityController import QualityController
+
+# Constants
+RING_SLOTS              = 4         # latest frame + one per reader + one being written
+RING_INFERENCE_READER   = 0
+RING_DISPLAY_READER     = 1
+RING_READERS            = 2
+HEADER_SEQUENCE         = 0
+HEADER_LATEST           = 1
+HEADER_CLAIMS           = 2
+SLOT_META_DTYPE         = np.dtype([("frameId", "<i8"), ("captureTime", "<f8")])
+FUSION_MAX_AGE          = 0.5       # seconds without results before a source loses control
+PROCESS_JOIN_TIMEOUT    = 2.0
+PROCESS_CHECK_INTERVAL  = 0.5       # seconds between liveness checks of the inference processes
+
+logger = logging.getLogger(__name__)
+
+
+class SharedFrameRing():
+
+    def __init__(self, shape, slots=RING_SLOTS, condition=None, name=None):
+        # the player creates the ring, inference processes attach to it when it is unpickled
+        self.shape     = tuple(shape)
+        self.slots     = slots
+        self.condition = condition
+        self.owner     = name is None
+        self.written   = -1
+
+        headerBytes = (HEADER_CLAIMS + RING_READERS) * 8
+        metaBytes   = slots * SLOT_META_DTYPE.itemsize
+        frameBytes  = math.prod(self.shape)
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner,
+                                                 size=headerBytes + metaBytes + slots * frameBytes)
+        self.header = np.ndarray(HEADER_CLAIMS + RING_READERS, np.int64, self.memory.buf)
+        self.meta   = np.ndarray(slots, SLOT_META_DTYPE, self.memory.buf, headerBytes)
+        self.frames = np.ndarray((slots,) + self.shape, np.uint8, self.memory.buf, headerBytes + metaBytes)
+        if self.owner:
+            self.header[:] = -1
+            self.header[HEADER_SEQUENCE] = 0
+            self.meta["frameId"] = -1
+
+    def __getstate__(self):
+        return {"shape": self.shape, "slots": self.slots, "condition": self.condition, "name": self.memory.name}
+
+    def __setstate__(self, state):
+        self.__init__(state["shape"], state["slots"], state["condition"], state["name"])
+
+    def writableSlot(self):
+        # a slot which is neither the latest frame nor claimed by a reader, marked as invalid until published
+        with self.condition:
+            busy = set(self.header[HEADER_LATEST:].tolist())
+            for step in range(1, self.slots + 1):
+                slot = (self.written + step) % self.slots
+                if slot not in busy:
+                    break
+            self.meta[slot]["frameId"] = -1
+        self.written = slot
+        return slot
+
+    def publish(self, slot, frameId, captureTime):
+        with self.condition:
+            self.meta[slot] = (frameId, captureTime)
+            self.header[HEADER_LATEST]    = slot
+            self.header[HEADER_SEQUENCE] += 1
+            self.condition.notify_all()
+
+    def claimLatest(self, reader, lastSequence, timeout=STAGE_POLL_TIMEOUT):
+        # (sequence, slot, frameId, captureTime) of a frame newer than lastSequence, None on timeout
+        # the claim holds until the reader claims another frame or releases it
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.header[HEADER_SEQUENCE] > lastSequence, timeout):
+                return None
+            slot = int(self.header[HEADER_LATEST])
+            self.header[HEADER_CLAIMS + reader] = slot
+            return int(self.header[HEADER_SEQUENCE]), slot, int(self.meta[slot]["frameId"]), float(self.meta[slot]["captureTime"])
+
+    def claimFrame(self, reader, slot, frameId):
+        # claims slot if it still holds frameId
+        with self.condition:
+            if self.meta[slot]["frameId"] != frameId:
+                return False
+            self.header[HEADER_CLAIMS + reader] = slot
+            return True
+
+    def release(self, reader):
+        with self.condition:
+            self.header[HEADER_CLAIMS + reader] = -1
+
+    def frame(self, slot):
+        return self.frames[slot]
+
+    def close(self):
+        # views into the shared memory must be gone before it can be closed
+        self.header = self.meta = self.frames = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class SourceResult():
+
+    def __init__(self, sourceIndex, frameId, slot, captureTime):
+        self.sourceIndex      = sourceIndex
+        self.frameId          = frameId
+        self.slot             = slot
+        self.captureTime      = captureTime
+        self.handLandmarks    = None
+        self.rawLandmarks     = None
+        self.region           = None
+        self.handDirections   = []
+        self.handBoxes        = []
+        self.controlIndex     = -1
+        self.gestureIds       = []
+        self.inferenceMs      = 0.0
+        self.inferenceSkipped = False
+        self.skippedFrames    = 0
+
+
+def runInference(sourceIndex, ring, resultQueue, stopEvent, options):
+    # entry point of the inference process of one source
+    gestureRules = loadGestureRules(options["gestureFile"]) if options.get("gestureFile") else None
+    handDetector = HandDetector(detectionCon=options["detectionCon"], motionGate=MotionGate(), roiTracking=True,
+                                searchSize=options["searchSize"], handPolicy=options["handPolicy"],
+                                gestureRules=gestureRules)
+    handClassifier    = HandClassifier(handDetector.gestureRules)
+    qualityController = QualityController(options["targetFps"], options["p95Budget"])
+    # a result still waiting in the queue must not keep this process alive
+    resultQueue.cancel_join_thread()
+
+    lastSequence = 0
+    while not stopEvent.is_set():
+        claim = ring.claimLatest(RING_INFERENCE_READER, lastSequence)
+        if claim is None:
+            continue
+
+        sequence, slot, frameId, captureTime = claim
+        result = SourceResult(sourceIndex, frameId, slot, captureTime)
+        result.skippedFrames = sequence - lastSequence - 1
+        lastSequence = sequence
+
+        qualityController.apply(handDetector)
+        startTime = time.perf_counter()
+        handDetector.detectHands(ring.frame(slot), draw=False)
+        result.inferenceMs      = (time.perf_counter() - startTime) * 1000.0
+        result.inferenceSkipped = handDetector.inferenceSkipped
+        if not handDetector.inferenceSkipped:
+            qualityController.record(result.inferenceMs)
+
+        result.handLandmarks  = handDetector.handLandmarks.copy()
+        result.rawLandmarks   = handDetector.rawLandmarks.copy()
+        result.region         = handDetector.region
+        result.handDirections = handDetector.handDirections
+        result.handBoxes      = handDetector.handBoxes
+        result.controlIndex   = handDetector.controlIndex
+        result.gestureIds     = handClassifier.classifyHandIds(result.handLandmarks, result.handDirections).tolist()
+        resultQueue.put(result)
+
+    ring.release(RING_INFERENCE_READER)
+    handDetector.hands.close()
+    handDetector = None
+    ring.close()
+
+
+class SourceCapture(threading.Thread):
+
+    def __init__(self, sourceIndex, source, cap, ring, stopEvent, metrics=None):
+        super().__init__(name="SourceCapture-%d" % sourceIndex, daemon=True)
+        self.source    = source
+        self.cap       = cap
+        self.ring      = ring
+        self.stopEvent = stopEvent
+        self.metrics   = metrics
+        self.frameId   = 0
+        self.rawFrame  = None
+
+    def run(self):
+        # cap is a CameraCapture, which paces video files, stamps every frame and records its wait and copy
+        height, width = self.ring.shape[:2]
+        while not self.stopEvent.is_set():
+            # the frame is mirrored straight into the ring, through rawFrame only when it has to be resized
+            slot   = self.ring.writableSlot()
+            target = self.ring.frame(slot)
+            success, image = self.cap.read(image=target if self.rawFrame is None else self.rawFrame, flipCode=1)
+            if not success:
+                time.sleep(CAPTURE_RETRY_DELAY)
+                continue
+
+            if image is not target:
+                startTime     = time.perf_counter()
+                self.rawFrame = image
+                cv2.resize(image, (width, height), dst=target)
+                if self.metrics is not None:
+                    self.metrics.record("resize", time.perf_counter() - startTime)
+            self.frameId += 1
+            self.ring.publish(slot, self.frameId, self.cap.captureTime)
+
+
+class MultiCameraPipeline(QtCore.QObject):
+
+    resultReady = QtCore.pyqtSignal()
+    # message of an inference process which died, emitted from the collector thread
+    failed      = QtCore.pyqtSignal(str)
+
+    def __init__(self, sources, caps, gestureRules, options, parent=None, metrics=None, recorder=None):
+        # options : detectionCon, searchSize, handPolicy, gestureFile, targetFps and p95Budget of the detectors
+        super().__init__(parent)
+        self.sources        = sources
+        self.caps           = caps
+        self.gestureRules   = gestureRules
+        self.options        = options
+        self.metrics        = metrics
+        self.recorder       = recorder
+        self.context        = multiprocessing.get_context("spawn")
+        self.stopEvent      = self.context.Event()
+        self.captureStop    = threading.Event()
+        self.resultQueue    = self.context.Queue()
+        self.resultSlot     = ResultSlot(self.resultReady.emit)
+        self.framePool      = FramePool()
+        self.rings          = []
+        self.processes      = []
+        self.threads        = []
+        self.latest         = {}
+        self.selectedSource = 0
+        self.skippedFrames  = 0
+        self.failedSources  = set()
+
+    def start(self):
+        for sourceIndex, (source, cap) in enumerate(zip(self.sources, self.caps)):
+            shape = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+            ring  = SharedFrameRing(shape, condition=self.context.Condition())
+            self.rings.append(ring)
+            self.processes.append(self.context.Process(target=runInference, name="Inference-%d" % sourceIndex,
+                                                       args=(sourceIndex, ring, self.resultQueue, self.stopEvent,
+                                                             self.options), daemon=True))
+            self.threads.append(SourceCapture(sourceIndex, source, cap, ring, self.captureStop, self.metrics))
+        self.threads.append(threading.Thread(target=self.collectResults, name="MultiCameraCollector", daemon=True))
+
+        for process in self.processes:
+            process.start()
+        for thread in self.threads:
+            thread.start()
+        logger.info("Started %d inference processes for %s", len(self.processes), self.sources)
+
+    def stop(self, timeout=1.0):
+        self.stopEvent.set()
+        self.captureStop.set()
+        for thread in self.threads:
+            if thread.is_alive():
+                thread.join(timeout)
+        for process in self.processes:
+            process.join(PROCESS_JOIN_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+        for ring in self.rings:
+            ring.close()
+        self.rings = []
+
+    def takeResult(self):
+        return self.resultSlot.take()
+
+    def droppedFrames(self):
+        return self.skippedFrames + self.resultSlot.dropped
+
+    def collectResults(self):
+        nextCheck = time.monotonic() + PROCESS_CHECK_INTERVAL
+        while not self.captureStop.is_set():
+            if time.monotonic() >= nextCheck:
+                self.checkProcesses()
+                nextCheck = time.monotonic() + PROCESS_CHECK_INTERVAL
+            try:
+                result = self.resultQueue.get(timeout=STAGE_POLL_TIMEOUT)
+            except queue.Empty:
+                continue
+
+            self.skippedFrames += result.skippedFrames
+            if self.metrics is not None and not result.inferenceSkipped:
+                self.metrics.record("inference", result.inferenceMs / 1000.0)
+            if self.selectSource(result):
+                self.resultSlot.put(self.makePacket(result))
+
+    def checkProcesses(self):
+        # a process which died (crash, killed for memory) is reported once, its source loses control
+        # after FUSION_MAX_AGE like a source which sees nothing
+        for sourceIndex, process in enumerate(self.processes):
+            if sourceIndex in self.failedSources or process.is_alive() or self.stopEvent.is_set():
+                continue
+            self.failedSources.add(sourceIndex)
+            message = "Inference process of %s stopped (exit code %s)" % (self.sources[sourceIndex], process.exitcode)
+            logger.error(message)
+            self.failed.emit(message)
+
+    def selectSource(self, result):
+        # True when the result belongs to the source in control, which may change to this one
+        self.latest[result.sourceIndex] = result
+        if result.sourceIndex == self.selectedSource:
+            return True
+
+        selected = self.latest.get(self.selectedSource)
+        selectedAlive = selected is not None and result.captureTime - selected.captureTime < FUSION_MAX_AGE
+        if selectedAlive and (result.controlIndex < 0 or selected.controlIndex >= 0):
+            return False
+
+        logger.info("Gestures from source %s", self.sources[result.sourceIndex])
+        self.selectedSource = result.sourceIndex
+        return True
+
+    def makePacket(self, result):
+        # copy of the frame the result belongs to, or of the newest one when it was overwritten meanwhile
+        ring  = self.rings[result.sourceIndex]
+        image = self.framePool.acquire(ring.shape)
+        if ring.claimFrame(RING_DISPLAY_READER, result.slot, result.frameId):
+            np.copyto(image, ring.frame(result.slot))
+        else:
+            claim = ring.claimLatest(RING_DISPLAY_READER, 0, timeout=0)
+            np.copyto(image, ring.frame(claim[1]))
+        ring.release(RING_DISPLAY_READER)
+
+        packet = FramePacket(result.frameId, image, result.captureTime, self.framePool)
+        gestures = self.gestureRules.gestures
+        packet.sourceIndex    = result.sourceIndex
+        packet.handLandmarks  = result.handLandmarks
+        packet.rawLandmarks   = result.rawLandmarks
+        packet.region         = result.region
+        packet.handDirections = result.handDirections
+        packet.handBoxes      = result.handBoxes
+        packet.controlIndex   = result.controlIndex
+        packet.handPositions  = [gestures[gestureId] for gestureId in result.gestureIds]
+        packet.gestureId      = result.gestureIds[result.controlIndex] if result.gestureIds else self.gestureRules.noHandId
+        packet.handPosition   = gestures[packet.gestureId]
+        if result.controlIndex >= 0:
+            packet.landmarks     = result.handLandmarks[result.controlIndex]
+            packet.handDirection = result.handDirections[result.controlIndex]
+            packet.bbox          = tuple(int(value) for value in result.handBoxes[result.controlIndex])
+
+        if self.recorder is not None:
+            self.recorder.write(packet.frameId, packet.captureTime, image.shape, packet.region,
+                                packet.rawLandmarks, packet.handDirections, result.gestureIds, packet.controlIndex)
+        return packet
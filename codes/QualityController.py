@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive quality controller for hand inference.
+
+The inference latency is measured on every frame which really went through the
+model. Once per evaluation window the controller compares the mean and p95
+latency with the configured budget and moves one step down (cheaper) or up
+(better) on a ladder of quality levels. Every switch is logged.
+"""
+
+import logging
+import collections
+import numpy as np
+
+# Constants
+DEFAULT_TARGET_FPS       = 30
+DEFAULT_P95_BUDGET_MS    = 40.0
+EVALUATION_WINDOW        = 60      # inference samples per decision
+STEP_UP_MARGIN           = 0.6     # step up only when well below the budget ...
+STEP_UP_WINDOWS          = 3       # ... for this many windows in a row
+MAX_STEP_UP_WINDOWS      = 48      # backoff limit after failed step ups
+
+logger = logging.getLogger(__name__)
+
+
+class QualityLevel():
+
+    def __init__(self, modelComplexity, searchSize, maxHands, inferenceInterval):
+        self.modelComplexity   = modelComplexity
+        self.searchSize        = searchSize
+        self.maxHands          = maxHands
+        self.inferenceInterval = inferenceInterval
+
+    def __repr__(self):
+        return "QualityLevel(modelComplexity=%d, searchSize=%s, maxHands=%d, inferenceInterval=%d)" % (
+            self.modelComplexity, self.searchSize, self.maxHands, self.inferenceInterval)
+
+
+# from the best to the cheapest
+QUALITY_LEVELS = [
+    QualityLevel(modelComplexity=1, searchSize=480, maxHands=2, inferenceInterval=1),
+    QualityLevel(modelComplexity=1, searchSize=320, maxHands=2, inferenceInterval=1),
+    QualityLevel(modelComplexity=0, searchSize=320, maxHands=2, inferenceInterval=1),
+    QualityLevel(modelComplexity=0, searchSize=256, maxHands=1, inferenceInterval=1),
+    QualityLevel(modelComplexity=0, searchSize=192, maxHands=1, inferenceInterval=2),
+    QualityLevel(modelComplexity=0, searchSize=160, maxHands=1, inferenceInterval=3),
+]
+
+
+class QualityController():
+
+    def __init__(self, targetFps=DEFAULT_TARGET_FPS, p95BudgetMs=DEFAULT_P95_BUDGET_MS,
+                 levels=QUALITY_LEVELS, startLevel=1):
+        self.frameBudgetMs = 1000.0 / targetFps
+        self.p95BudgetMs   = p95BudgetMs
+        self.levels        = levels
+        self.levelIndex    = startLevel
+        self.latencies     = collections.deque(maxlen=EVALUATION_WINDOW)
+        self.goodWindows   = 0
+        self.stepUpWindows = STEP_UP_WINDOWS
+        self.steppedUp     = False
+        self.pending       = True
+
+    def currentLevel(self):
+        return self.levels[self.levelIndex]
+
+    def apply(self, handDetector):
+        # called by the inference thread before detectHands
+        if self.pending:
+            level = self.currentLevel()
+            handDetector.configure(level.modelComplexity, level.maxHands, level.searchSize, level.inferenceInterval)
+            self.pending = False
+
+    def record(self, latencyMs):
+        self.latencies.append(latencyMs)
+        if len(self.latencies) == EVALUATION_WINDOW:
+            self.evaluate()
+
+    def evaluate(self):
+        samples = np.fromiter(self.latencies, dtype=float, count=len(self.latencies))
+        meanMs  = samples.mean()
+        p95Ms   = np.percentile(samples, 95)
+        self.latencies.clear()
+
+        steppedUp, self.steppedUp = self.steppedUp, False
+        if p95Ms > self.p95BudgetMs or meanMs > self.frameBudgetMs:
+            # the better level did not fit right after stepping up : wait longer before the next try
+            if steppedUp:
+                self.stepUpWindows = min(self.stepUpWindows * 2, MAX_STEP_UP_WINDOWS)
+            self.goodWindows = 0
+            self.switchTo(self.levelIndex + 1, meanMs, p95Ms)
+        elif p95Ms < self.p95BudgetMs * STEP_UP_MARGIN and meanMs < self.frameBudgetMs * STEP_UP_MARGIN:
+            self.goodWindows += 1
+            if self.goodWindows >= self.stepUpWindows:
+                self.goodWindows = 0
+                self.steppedUp   = self.switchTo(self.levelIndex - 1, meanMs, p95Ms)
+        else:
+            self.goodWindows = 0
+
+    def switchTo(self, levelIndex, meanMs, p95Ms):
+        levelIndex = min(max(levelIndex, 0), len(self.levels) - 1)
+        if levelIndex == self.levelIndex:
+            return False
+
+        logger.info("Inference mean %.1f ms, p95 %.1f ms (budget %.1f / %.1f ms) : quality level %d -> %d %s",
+                    meanMs, p95Ms, self.frameBudgetMs, self.p95BudgetMs,
+                    self.levelIndex, levelIndex, self.levels[levelIndex])
+        self.levelIndex = levelIndex
+        self.pending    = True
+        return True
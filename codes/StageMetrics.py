@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Lightweight per-stage timing for the gesture pipeline.
+
+Every stage keeps a rolling histogram with log spaced buckets, so recording a
+sample is one bisect and one list increment, under a lock of the stage since
+the capture threads of several cameras record into the same stages.
+Percentiles are read from the last one or two windows. MetricsExporter
+periodically writes the snapshot as a CSV log or as a Prometheus text file
+(chosen by the .prom extension).
+"""
+
+import os
+import time
+import bisect
+import threading
+
+# Constants
+BUCKET_MIN_SECONDS    = 1e-6
+BUCKET_GROWTH         = 1.2
+BUCKET_COUNT          = 100       # up to ~80 s
+ROLLING_WINDOW        = 10.0      # seconds
+EXPORT_INTERVAL       = 5.0       # seconds
+PROMETHEUS_EXTENSION  = ".prom"
+PROMETHEUS_METRIC     = "gesture_stage_seconds"
+CSV_HEADER            = "timestamp,stage,count,mean_ms,p50_ms,p95_ms,p99_ms\n"
+OVERLAY_PERCENTILES   = [50, 95]
+
+BUCKET_EDGES = [BUCKET_MIN_SECONDS * BUCKET_GROWTH ** i for i in range(BUCKET_COUNT)]
+
+
+class StageHistogram():
+
+    def __init__(self):
+        self.current     = [0] * (BUCKET_COUNT + 1)
+        self.previous    = [0] * (BUCKET_COUNT + 1)
+        self.windowStart = time.monotonic()
+        self.last        = 0.0
+        self.totalCount  = 0
+        self.totalSum    = 0.0
+        # several threads record into the same stage, e.g. the capture threads of every camera
+        self.lock        = threading.Lock()
+
+    def record(self, seconds):
+        bucket = bisect.bisect_left(BUCKET_EDGES, seconds)
+        with self.lock:
+            now = time.monotonic()
+            if now - self.windowStart > ROLLING_WINDOW:
+                self.previous, self.current = self.current, [0] * (BUCKET_COUNT + 1)
+                self.windowStart = now
+
+            self.current[bucket] += 1
+            self.last        = seconds
+            self.totalCount += 1
+            self.totalSum   += seconds
+
+    def totals(self):
+        # (count, sum) since the start, read together
+        with self.lock:
+            return self.totalCount, self.totalSum
+
+    def percentiles(self, percentiles):
+        # upper bucket edge in seconds for every percentile, over the last one or two windows
+        with self.lock:
+            counts = [a + b for a, b in zip(self.current, self.previous)]
+        total  = sum(counts)
+        if total == 0:
+            return [0.0] * len(percentiles)
+
+        result   = []
+        targets  = iter(sorted(percentiles))
+        target   = next(targets)
+        seen     = 0
+        for index, count in enumerate(counts):
+            seen += count
+            while target is not None and seen >= total * target / 100.0:
+                result.append(BUCKET_EDGES[min(index, BUCKET_COUNT - 1)])
+                target = next(targets, None)
+            if target is None:
+                break
+        return result
+
+    def windowCount(self):
+        with self.lock:
+            return sum(self.current) + sum(self.previous)
+
+
+class StageMetrics():
+
+    def __init__(self):
+        self.stages = {}
+        self.lock   = threading.Lock()
+
+    def record(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.stages.setdefault(stage, StageHistogram())
+        histogram.record(seconds)
+
+    def snapshot(self):
+        # stage -> dict of count, mean, p50, p95, p99 (seconds) and cumulative totals
+        result = {}
+        for stage, histogram in list(self.stages.items()):
+            p50, p95, p99 = histogram.percentiles([50, 95, 99])
+            totalCount, totalSum = histogram.totals()
+            result[stage] = {
+                "count"     : histogram.windowCount(),
+                "mean"      : totalSum / totalCount if totalCount else 0.0,
+                "p50"       : p50,
+                "p95"       : p95,
+                "p99"       : p99,
+                "last"      : histogram.last,
+                "totalCount": totalCount,
+                "totalSum"  : totalSum,
+            }
+        return result
+
+    def overlayLines(self):
+        lines = []
+        for stage, values in self.snapshot().items():
+            lines.append("%-10s %6.1f / %6.1f ms" % (stage, values["p50"] * 1000.0, values["p95"] * 1000.0))
+        return lines
+
+
+class MetricsExporter(threading.Thread):
+
+    def __init__(self, metrics, path, interval=EXPORT_INTERVAL):
+        super().__init__(name="MetricsExporter", daemon=True)
+        self.metrics   = metrics
+        self.path      = path
+        self.interval  = interval
+        self.stopEvent = threading.Event()
+
+    def run(self):
+        while not self.stopEvent.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def stop(self):
+        self.stopEvent.set()
+
+    def flush(self):
+        snapshot = self.metrics.snapshot()
+        if self.path.endswith(PROMETHEUS_EXTENSION):
+            self.writePrometheus(snapshot)
+        else:
+            self.appendCsv(snapshot)
+
+    def writePrometheus(self, snapshot):
+        lines = ["# HELP %s Gesture pipeline stage duration." % PROMETHEUS_METRIC,
+                 "# TYPE %s summary" % PROMETHEUS_METRIC]
+        for stage, values in snapshot.items():
+            for quantile in ("0.5", "0.95", "0.99"):
+                key = "p%d" % round(float(quantile) * 100)
+                lines.append('%s{stage="%s",quantile="%s"} %.9f' % (PROMETHEUS_METRIC, stage, quantile, values[key]))
+            lines.append('%s_count{stage="%s"} %d' % (PROMETHEUS_METRIC, stage, values["totalCount"]))
+            lines.append('%s_sum{stage="%s"} %.9f' % (PROMETHEUS_METRIC, stage, values["totalSum"]))
+
+        # scrapers (node exporter textfile collector) must never see a half written file
+        temporaryPath = self.path + ".tmp"
+        with open(temporaryPath, "w") as metricsFile:
+            metricsFile.write("\n".join(lines) + "\n")
+        os.replace(temporaryPath, self.path)
+
+    def appendCsv(self, snapshot):
+        writeHeader = not os.path.exists(self.path)
+        timestamp   = time.time()
+        with open(self.path, "a") as metricsFile:
+            if writeHeader:
+                metricsFile.write(CSV_HEADER)
+            for stage, values in snapshot.items():
+                metricsFile.write("%.3f,%s,%d,%.4f,%.4f,%.4f,%.4f\n" % (
+                    timestamp, stage, values["count"], values["mean"] * 1000.0,
+                    values["p50"] * 1000.0, values["p95"] * 1000.0, values["p99"] * 1000.0))
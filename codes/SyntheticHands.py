@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic hand landmarks for benchmarks and offline checks, no camera needed.
+
+Hands are built in a local frame (u towards the thumb, v along the fingers) from
+per-finger up/down states, then placed in the image : upright for the finger
+gestures, turned sideways for the volume gestures. syntheticResults wraps them
+in the same protobuf messages MediaPipe Hands returns.
+"""
+
+import types
+import numpy as np
+from mediapipe.framework.formats import landmark_pb2, classification_pb2
+from HandDetector import HandClassifier, NUM_LANDMARKS, NUM_AXES
+
+# Constants
+HAND_SCALE          = 1.5     # pixels per local unit
+HAND_CENTER         = (200.0, 260.0)
+FINGER_BASES_U      = [20.0, 5.0, -10.0, -25.0]          # index, middle, ring, pinky
+FINGER_UP_V         = [60.0, 85.0, 100.0, 115.0]         # MCP, PIP, DIP, TIP
+FINGER_DOWN_V       = [60.0, 80.0, 65.0, 55.0]
+THUMB_UV            = [(15.0, 10.0), (30.0, 25.0), (40.0, 35.0)]   # CMC, MCP, IP
+THUMB_TIP_UP_UV     = (55.0, 45.0)
+THUMB_TIP_DOWN_UV   = (25.0, 30.0)
+
+# gesture -> (thumb, index, middle, ring, pinky) up states and whether the hand is sideways
+GESTURE_POSES = {
+    HandClassifier.HAND_POSITION_OPEN       : ((1, 1, 1, 1, 1), False),
+    HandClassifier.HAND_POSITION_CLOSE      : ((0, 0, 0, 0, 0), False),
+    HandClassifier.HAND_POSITION_VICTORY    : ((0, 1, 1, 0, 0), False),
+    HandClassifier.HAND_POSITION_IGNORE     : ((0, 0, 0, 1, 1), False),
+    HandClassifier.HAND_POSITION_THUMB_UP   : ((1, 0, 0, 0, 0), True),
+    HandClassifier.HAND_POSITION_THUMB_DOWN : ((1, 0, 0, 0, 0), True),
+}
+
+SYNTHETIC_DIRECTIONS = [HandClassifier.HAND_DIRECTION_LEFT, HandClassifier.HAND_DIRECTION_RIGHT]
+
+
+def localHand(fingerStates):
+    # (21, 2) landmarks in the local (u, v) frame
+    points = np.zeros((NUM_LANDMARKS, 2))
+    points[1:4] = THUMB_UV
+    points[4]   = THUMB_TIP_UP_UV if fingerStates[0] else THUMB_TIP_DOWN_UV
+    for finger in range(4):
+        first = 5 + finger * 4
+        points[first:first + 4, 0] = FINGER_BASES_U[finger]
+        points[first:first + 4, 1] = FINGER_UP_V if fingerStates[finger + 1] else FINGER_DOWN_V
+    return points
+
+
+def syntheticHand(gesture, direction, center=HAND_CENTER, scale=HAND_SCALE, jitter=0.0, rng=None):
+    # (21, 3) pixel landmarks which HandClassifier classifies as gesture for that hand direction
+    fingerStates, sideways = GESTURE_POSES[gesture]
+    u, v = localHand(fingerStates).T
+    mirror = 1.0 if direction == HandClassifier.HAND_DIRECTION_RIGHT else -1.0
+
+    landmarks = np.zeros((NUM_LANDMARKS, NUM_AXES))
+    if sideways:
+        # fingers point towards the thumb side, thumb up or down
+        thumbSign = -1.0 if gesture == HandClassifier.HAND_POSITION_THUMB_UP else 1.0
+        landmarks[:, 0] = center[0] + mirror * v * scale
+        landmarks[:, 1] = center[1] + thumbSign * u * scale
+    else:
+        landmarks[:, 0] = center[0] + mirror * u * scale
+        landmarks[:, 1] = center[1] - v * scale
+
+    if jitter > 0:
+        rng = np.random.default_rng() if rng is None else rng
+        landmarks[:, :2] += rng.normal(0.0, jitter, (NUM_LANDMARKS, 2))
+
+    return np.trunc(landmarks)
+
+
+def syntheticFixtures(count, jitter=1.0, seed=0):
+    # list of (landmarks, direction, expected gesture) covering every gesture and direction
+    rng = np.random.default_rng(seed)
+    gestures = list(GESTURE_POSES)
+    fixtures = []
+    for index in range(count):
+        gesture   = gestures[index % len(gestures)]
+        direction = SYNTHETIC_DIRECTIONS[(index // len(gestures)) % len(SYNTHETIC_DIRECTIONS)]
+        fixtures.append((syntheticHand(gesture, direction, jitter=jitter, rng=rng), direction, gesture))
+    return fixtures
+
+
+def syntheticResults(hands, imageShape):
+    # MediaPipe shaped results for a list of (landmarks, direction), as hands.process returns them
+    h, w = imageShape[:2]
+    handLandmarks = []
+    handedness    = []
+    for landmarks, direction in hands:
+        landmarkList = landmark_pb2.NormalizedLandmarkList()
+        for x, y, z in landmarks:
+            landmarkList.landmark.add(x=x / w, y=y / h, z=z)
+        handLandmarks.append(landmarkList)
+
+        # MediaPipe labels are mirrored compared to HandDetector directions
+        label = (HandClassifier.HAND_DIRECTION_LEFT if direction == HandClassifier.HAND_DIRECTION_RIGHT
+                 else HandClassifier.HAND_DIRECTION_RIGHT)
+        classificationList = classification_pb2.ClassificationList()
+        classificationList.classification.add(index=0, score=1.0, label=label)
+        handedness.append(classificationList)
+
+    return types.SimpleNamespace(multi_hand_landmarks=handLandmarks or None,
+                                 multi_handedness=handedness or None)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+LandmarkWindow features and DynamicGestureDetector events on synthetic hands
+moved and turned frame by frame.
+"""
+
+import os
+import sys
+import math
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from HandDetector import HandClassifier
+from SyntheticHands import syntheticHand
+from DynamicGestures import (LandmarkWindow, DynamicGestureDetector, PALM_LANDMARKS, WRIST, MIDDLE_FINGER_MCP,
+                             DYNAMIC_SWIPE_LEFT, DYNAMIC_SWIPE_RIGHT, DYNAMIC_ROTATE)
+
+# Constants
+IMAGE_WIDTH          = 640
+FRAME_SECONDS        = 1.0 / 30
+OPEN_HAND            = syntheticHand(HandClassifier.HAND_POSITION_OPEN, HandClassifier.HAND_DIRECTION_RIGHT)
+OPEN_HAND_ANGLE      = math.degrees(math.atan2(OPEN_HAND[MIDDLE_FINGER_MCP, 1] - OPEN_HAND[WRIST, 1],
+                                               OPEN_HAND[MIDDLE_FINGER_MCP, 0] - OPEN_HAND[WRIST, 0]))
+RIGHT_HAND           = (0, HandClassifier.HAND_DIRECTION_RIGHT)
+LEFT_HAND            = (1, HandClassifier.HAND_DIRECTION_LEFT)
+
+
+def handAt(x, y, degrees=0.0):
+    # the open hand turned by degrees (clockwise on screen) around its palm center, moved to (x, y) pixels
+    palm   = OPEN_HAND[PALM_LANDMARKS, :2].mean(axis=0)
+    turn   = math.radians(degrees)
+    matrix = np.array([[math.cos(turn), -math.sin(turn)], [math.sin(turn), math.cos(turn)]])
+    landmarks = OPEN_HAND.copy()
+    landmarks[:, :2] = (OPEN_HAND[:, :2] - palm) @ matrix.T + (x, y)
+    return landmarks
+
+
+def run(detector, positions, hand=RIGHT_HAND, canRotate=True):
+    # (x, y, degrees) per frame -> (frame, name, value) of every event
+    emitted = []
+    for frame, (x, y, degrees) in enumerate(positions):
+        for gesture in detector.update(handAt(x, y, degrees), IMAGE_WIDTH, frame * FRAME_SECONDS, hand, canRotate):
+            emitted.append((frame, gesture.name, gesture.value))
+    return emitted
+
+
+def test_windowFeaturesMatchDirectSums():
+    # a random walk through more frames than the window holds, so the ring wraps around
+    rng     = np.random.default_rng(7)
+    window  = LandmarkWindow(windowFrames=5)
+    centers, angles, times = [], [], []
+    for frame in range(13):
+        x, y    = 320 + rng.normal(0, 20, 2)
+        degrees = rng.uniform(-30, 30)
+        window.push(handAt(x, y, degrees), IMAGE_WIDTH, frame * 0.05)
+        centers.append(np.array([x, y]) / IMAGE_WIDTH)
+        angles.append(degrees)
+        times.append(frame * 0.05)
+
+        last = slice(max(0, frame - 4), frame + 1)
+        path = sum(np.hypot(*(b - a)) for a, b in zip(centers[last][:-1], centers[last][1:]))
+        assert window.count == min(frame + 1, 5)
+        assert window.duration() == pytest.approx(times[frame] - times[last.start])
+        assert window.displacement() == pytest.approx(centers[frame] - centers[last.start])
+        assert window.pathLength() == pytest.approx(path)
+        assert window.rotation() == pytest.approx(angles[frame] - angles[last.start])
+        assert window.rotation(2) == pytest.approx(window.lastTurn())
+
+
+def test_rotationUnwrapsAcrossHalfTurn():
+    # 10 degree steps through +-180 degrees of atan2 add up instead of jumping by 360
+    window = LandmarkWindow(windowFrames=8)
+    start  = 180.0 - OPEN_HAND_ANGLE - 30.0
+    for frame in range(7):
+        window.push(handAt(320, 240, start + 10.0 * frame), IMAGE_WIDTH, frame * FRAME_SECONDS)
+    assert window.rotation() == pytest.approx(60.0)
+    assert window.lastTurn() == pytest.approx(10.0)
+
+
+def test_windowNeedsTwoFrames():
+    with pytest.raises(ValueError):
+        LandmarkWindow(windowFrames=1)
+
+
+@pytest.mark.parametrize("step, name", [(30, DYNAMIC_SWIPE_RIGHT), (-30, DYNAMIC_SWIPE_LEFT)])
+def test_swipe(step, name):
+    # 0.25 image widths are 160 pixels : the sixth step of 30 pixels crosses them
+    detector = DynamicGestureDetector()
+    events   = run(detector, [(320 + step * frame, 240, 0.0) for frame in range(7)])
+    assert events == [(6, name, pytest.approx(step * 6 / IMAGE_WIDTH / (6 * FRAME_SECONDS)))]
+    # the window starts over after a swipe
+    assert detector.window.count == 0
+
+
+def test_swipeCooldown():
+    # the hand keeps moving after the swipe at 0.2 s : nothing more until 0.7 s, then the next swipe
+    detector = DynamicGestureDetector()
+    events   = run(detector, [(30 * frame, 240, 0.0) for frame in range(21)])
+    assert [frame for frame, name, value in events] == [6]
+    swipe, = detector.update(handAt(30 * 22, 240), IMAGE_WIDTH, 22 * FRAME_SECONDS, RIGHT_HAND)
+    assert swipe.name == DYNAMIC_SWIPE_RIGHT
+
+
+@pytest.mark.parametrize("positions", [
+    [(320 + 10 * frame, 240, 0.0) for frame in range(30)],              # too slow for the window
+    [(320 + 30 * frame, 240 + 20 * frame, 0.0) for frame in range(8)],  # too steep
+    [(320 + 30 * frame, 240 + (-60 if frame % 2 else 60), 0.0) for frame in range(8)],  # zigzag
+])
+def test_noSwipe(positions):
+    events = run(DynamicGestureDetector(), positions)
+    assert not [name for frame, name, value in events if name != DYNAMIC_ROTATE]
+
+
+def test_handChangeStartsOver():
+    # two hands far apart are not a swipe
+    detector = DynamicGestureDetector()
+    assert detector.update(handAt(100, 240), IMAGE_WIDTH, 0.0, RIGHT_HAND) == []
+    assert detector.update(handAt(540, 240), IMAGE_WIDTH, FRAME_SECONDS, LEFT_HAND) == []
+    assert detector.window.count == 1
+    assert detector.update(None, IMAGE_WIDTH, 2 * FRAME_SECONDS) == []
+    assert detector.window.count == 0
+
+
+def test_rotateDeadZone():
+    # 6 degrees per frame : engaged at 24 degrees with the 4 beyond the dead zone, then every turn
+    detector = DynamicGestureDetector()
+    events   = run(detector, [(320, 240, 6.0 * frame) for frame in range(7)])
+    assert events == [(4, DYNAMIC_ROTATE, pytest.approx(4.0)), (5, DYNAMIC_ROTATE, pytest.approx(6.0)),
+                      (6, DYNAMIC_ROTATE, pytest.approx(6.0))]
+
+    counterClockwise = run(DynamicGestureDetector(), [(320, 240, -6.0 * frame) for frame in range(5)])
+    assert counterClockwise == [(4, DYNAMIC_ROTATE, pytest.approx(-4.0))]
+
+
+def test_rotateNeedsOpenHand():
+    detector = DynamicGestureDetector()
+    assert run(detector, [(320, 240, 6.0 * frame) for frame in range(7)], canRotate=False) == []
+
+    # rotating stops as soon as the hand closes, and the turn made while closed does not count
+    detector = DynamicGestureDetector()
+    run(detector, [(320, 240, 6.0 * frame) for frame in range(6)])
+    assert detector.rotating
+    assert detector.update(handAt(320, 240, 42.0), IMAGE_WIDTH, 1.0, RIGHT_HAND, canRotate=False) == []
+    assert not detector.rotating
+    assert detector.update(handAt(320, 240, 48.0), IMAGE_WIDTH, 1.1, RIGHT_HAND) == []
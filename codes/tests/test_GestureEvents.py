@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+START, HOLD and END events of GestureEventEngine on synthetic gesture id sequences.
+"""
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from GestureEvents import GestureEventEngine, EVENT_START, EVENT_HOLD, EVENT_END
+
+# Constants
+FRAME_SECONDS        = 0.1
+PLAY, STOP           = 1, 2
+
+
+def feed(engine, gestureIds, firstFrame=0):
+    # one frame every FRAME_SECONDS -> (frame, event type, gesture id) of every event
+    emitted = []
+    for frame, gestureId in enumerate(gestureIds, firstFrame):
+        for event in engine.update(gestureId, frame * FRAME_SECONDS):
+            emitted.append((frame, event.eventType, event.gestureId))
+    return emitted
+
+
+def test_startNeedsAgreeFrames():
+    # the third PLAY of the window starts it, the STOP in between does not reset the count
+    engine = GestureEventEngine(agreeFrames=3, windowFrames=5)
+    assert feed(engine, [PLAY, PLAY, STOP, PLAY]) == [(3, EVENT_START, PLAY)]
+
+
+def test_singleFrameBlipDoesNothing():
+    engine = GestureEventEngine(agreeFrames=3, windowFrames=5)
+    events = feed(engine, [PLAY, PLAY, PLAY, STOP, PLAY, PLAY])
+    assert events == [(2, EVENT_START, PLAY), (3, EVENT_HOLD, PLAY), (4, EVENT_HOLD, PLAY), (5, EVENT_HOLD, PLAY)]
+
+
+def test_holdCarriesDurationAndElapsed():
+    engine = GestureEventEngine(agreeFrames=3, windowFrames=5)
+    feed(engine, [PLAY, PLAY, PLAY])
+    hold, = engine.update(PLAY, 0.25)
+    assert hold.eventType == EVENT_HOLD
+    assert hold.duration == pytest.approx(0.25 - 2 * FRAME_SECONDS)
+    assert hold.elapsed == pytest.approx(0.25 - 2 * FRAME_SECONDS)
+    hold, = engine.update(PLAY, 0.3)
+    assert hold.duration == pytest.approx(0.3 - 2 * FRAME_SECONDS)
+    assert hold.elapsed == pytest.approx(0.05)
+
+
+def test_endComesBeforeNextStart():
+    # STOP takes the majority on the frame PLAY loses it : END of PLAY first, then START of STOP
+    engine = GestureEventEngine(agreeFrames=3, windowFrames=5)
+    events = feed(engine, [PLAY, PLAY, PLAY, STOP, STOP, STOP])
+    assert events == [(2, EVENT_START, PLAY), (3, EVENT_HOLD, PLAY), (4, EVENT_HOLD, PLAY),
+                      (5, EVENT_END, PLAY), (5, EVENT_START, STOP)]
+    assert [event.eventType for event in engine.update(STOP, 0.6)] == [EVENT_HOLD]
+
+
+def test_endWithoutNewMajority():
+    engine = GestureEventEngine(agreeFrames=3, windowFrames=5)
+    events = feed(engine, [PLAY, PLAY, PLAY, STOP, 3, 4])
+    assert events[-1] == (5, EVENT_END, PLAY)
+    assert engine.activeId is None
+
+
+def test_resetForgetsWindow():
+    engine = GestureEventEngine(agreeFrames=3, windowFrames=5)
+    feed(engine, [PLAY, PLAY, PLAY])
+    engine.reset()
+    # no END for the forgotten gesture, and it has to win the window again
+    assert feed(engine, [PLAY, PLAY, PLAY], firstFrame=10) == [(12, EVENT_START, PLAY)]
+
+
+@pytest.mark.parametrize("agreeFrames, windowFrames", [(2, 5), (2, 4), (6, 5), (0, 1)])
+def test_agreeFramesMustBeMajority(agreeFrames, windowFrames):
+    with pytest.raises(ValueError):
+        GestureEventEngine(agreeFrames, windowFrames)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Compiling gesture rules into the lookup table, and rules loaded from a JSON file
+on top of the built in ones.
+"""
+
+import os
+import sys
+import json
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from HandDetector import HandClassifier, DEFAULT_GESTURE_TABLE, loadGestureRules
+from GestureRules import (GestureRule, GestureRuleTable, ORIENTATION_UPRIGHT, ORIENTATION_THUMB_UP,
+                          ORIENTATION_THUMB_DOWN, ACTION_STOP, ACTION_PLAY, ACTION_NEXT, ACTION_IGNORE)
+
+# Constants
+FIST_MASK            = 0b00000
+ROCK_MASK            = 0b10010     # index and pinky, bit 0 is the thumb
+
+
+def writeRules(tmp_path, gestures):
+    path = tmp_path / "gestures.json"
+    path.write_text(json.dumps({"gestures": gestures}))
+    return str(path)
+
+
+def actionOf(table, fingersUpMask, orientation=ORIENTATION_UPRIGHT):
+    return table.actions[table.lookup(orientation, fingersUpMask)]
+
+
+def test_configRemapsBuiltInGesture(tmp_path):
+    path  = writeRules(tmp_path, [{"name": HandClassifier.HAND_POSITION_CLOSE, "fingers": "00000", "action": "stop"}])
+    table = loadGestureRules(path)
+    assert actionOf(DEFAULT_GESTURE_TABLE, FIST_MASK) == ACTION_PLAY
+    assert actionOf(table, FIST_MASK) == ACTION_STOP
+    assert table.gestures[table.lookup(ORIENTATION_UPRIGHT, FIST_MASK)] == HandClassifier.HAND_POSITION_CLOSE
+    # the other built in gestures are still there
+    assert sorted(table.gestures) == sorted(DEFAULT_GESTURE_TABLE.gestures)
+
+
+def test_configReplacesBuiltInPattern(tmp_path):
+    # the built in pattern of a replaced gesture falls through to the next matching rule
+    path  = writeRules(tmp_path, [{"name": HandClassifier.HAND_POSITION_INDEX_UP, "fingers": "01001", "action": "next"}])
+    table = loadGestureRules(path)
+    assert actionOf(table, ROCK_MASK) == ACTION_NEXT
+    assert table.gestures[table.lookup(ORIENTATION_UPRIGHT, 0b00010)] == HandClassifier.HAND_POSITION_IGNORE
+
+
+def test_conflictWithinConfigIsRejected(tmp_path):
+    path = writeRules(tmp_path, [{"name": "Rock", "fingers": "01001", "action": "stop"},
+                                 {"name": "Rock", "fingers": "11001", "action": "play"}])
+    with pytest.raises(ValueError, match="bound to both"):
+        loadGestureRules(path)
+
+
+def test_firstMatchingRuleWins():
+    table = GestureRuleTable([GestureRule("Point", "x1000", "upright", "next"),
+                              GestureRule("Fist", "00000", "any", "play"),
+                              GestureRule("Other", "xxxxx", "any", "ignore"),
+                              GestureRule("None", "xxxxx", "noHand", "noHand")])
+    assert table.gestures == ["Point", "Fist", "Other", "None"]
+    assert actionOf(table, 0b00010) == ACTION_NEXT
+    assert actionOf(table, 0b00011) == ACTION_NEXT
+    assert actionOf(table, FIST_MASK) == ACTION_PLAY
+    # "any" covers the sideways hands, where Point is not declared
+    assert actionOf(table, 0b00010, ORIENTATION_THUMB_UP) == ACTION_IGNORE
+    assert actionOf(table, FIST_MASK, ORIENTATION_THUMB_DOWN) == ACTION_PLAY
+    assert table.noHandId == table.gestures.index("None")
+    assert table.openHandId == table.gestures.index("Other")
+
+
+def test_uncoveredCellIsRejected():
+    with pytest.raises(ValueError, match="No gesture rule for orientation noHand"):
+        GestureRuleTable([GestureRule("Other", "xxxxx", "any", "ignore")])
+    with pytest.raises(ValueError, match="orientation upright and fingers 00001"):
+        GestureRuleTable([GestureRule("Other", "xxxx0", "any", "ignore"),
+                          GestureRule("None", "xxxxx", "noHand", "noHand")])
+
+
+@pytest.mark.parametrize("fingers, orientation, action", [
+    ("0100", "upright", "play"), ("01002", "upright", "play"),
+    ("01000", "sideways", "play"), ("01000", "upright", "rewind"),
+])
+def test_invalidRuleIsRejected(fingers, orientation, action):
+    with pytest.raises(ValueError):
+        GestureRule("Bad", fingers, orientation, action)
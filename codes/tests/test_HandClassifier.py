@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+classifyHandIds against the per-finger checks HandDetector.getHandPosition
+made before the classifier became a lookup table, on random and synthetic hands.
+"""
+
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from HandDetector import HandClassifier, DEFAULT_GESTURE_RULES, NUM_LANDMARKS, NUM_AXES
+from GestureRules import GestureRuleTable
+from SyntheticHands import syntheticFixtures, SYNTHETIC_DIRECTIONS
+
+# Constants
+RANDOM_HANDS         = 50000
+SYNTHETIC_HANDS      = 6000
+DIRECTIONS           = SYNTHETIC_DIRECTIONS + [HandClassifier.HAND_DIRECTION_NONE]
+THUMB_TIP, THUMB_IP, THUMB_MCP, PINKY_PIP = 4, 3, 2, 18
+FINGER_TIP_IDS       = [8, 12, 16, 20]
+
+# gestures the original classifier knew, the later ones (IndexUp, ThreeUp) fall into Ignore there
+ORIGINAL_GESTURES    = [HandClassifier.HAND_POSITION_THUMB_UP, HandClassifier.HAND_POSITION_THUMB_DOWN,
+                        HandClassifier.HAND_POSITION_VICTORY, HandClassifier.HAND_POSITION_OPEN,
+                        HandClassifier.HAND_POSITION_CLOSE, HandClassifier.HAND_POSITION_IGNORE,
+                        HandClassifier.HAND_POSITION_NO_HAND]
+ORIGINAL_RULES       = GestureRuleTable([rule for rule in DEFAULT_GESTURE_RULES if rule.name in ORIGINAL_GESTURES])
+
+
+def referenceFingersUp(landmarks, direction):
+    fingers = []
+    # Thumb
+    if direction == HandClassifier.HAND_DIRECTION_RIGHT and landmarks[THUMB_TIP, 0] > landmarks[THUMB_IP, 0]:
+        fingers.append(1)
+    elif direction == HandClassifier.HAND_DIRECTION_LEFT and landmarks[THUMB_TIP, 0] < landmarks[THUMB_IP, 0]:
+        fingers.append(1)
+    else:
+        fingers.append(0)
+
+    # Other Fingers
+    for tipId in FINGER_TIP_IDS:
+        fingers.append(1 if landmarks[tipId, 1] < landmarks[tipId - 2, 1] else 0)
+    return fingers
+
+
+def referenceVolumePosition(landmarks, direction):
+    if direction == HandClassifier.HAND_DIRECTION_LEFT:
+        # Is hand vertical
+        if landmarks[THUMB_MCP, 0] < landmarks[PINKY_PIP, 0]:
+            return False
+        for tipId in FINGER_TIP_IDS:
+            if landmarks[tipId, 0] < landmarks[tipId - 2, 0]:
+                return False
+    else:
+        # Is hand vertical
+        if landmarks[THUMB_MCP, 0] > landmarks[PINKY_PIP, 0]:
+            return False
+        for tipId in FINGER_TIP_IDS:
+            if landmarks[tipId, 0] > landmarks[tipId - 2, 0]:
+                return False
+    return True
+
+
+def referenceHandPosition(landmarks, direction):
+    upFingers      = referenceFingersUp(landmarks, direction)
+    sumOfUpFingers = sum(upFingers)
+
+    if direction == HandClassifier.HAND_DIRECTION_NONE:
+        return HandClassifier.HAND_POSITION_NO_HAND
+    elif referenceVolumePosition(landmarks, direction):
+        if landmarks[THUMB_TIP, 1] > landmarks[THUMB_IP, 1]:
+            return HandClassifier.HAND_POSITION_THUMB_DOWN
+        else:
+            return HandClassifier.HAND_POSITION_THUMB_UP
+    elif sumOfUpFingers == 2 and upFingers[1] == 1 and upFingers[2] == 1:
+        return HandClassifier.HAND_POSITION_VICTORY
+    elif sumOfUpFingers == 5:
+        return HandClassifier.HAND_POSITION_OPEN
+    elif sumOfUpFingers == 0:
+        return HandClassifier.HAND_POSITION_CLOSE
+    else:
+        return HandClassifier.HAND_POSITION_IGNORE
+
+
+def assertSameGestures(handLandmarks, handDirections):
+    classifier = HandClassifier(ORIGINAL_RULES)
+    gestures   = classifier.classifyHands(handLandmarks, handDirections)
+    for index, (landmarks, direction) in enumerate(zip(handLandmarks, handDirections)):
+        expected = referenceHandPosition(landmarks, direction)
+        assert gestures[index] == expected, "hand %d (%s) : %s instead of %s" % (index, direction, gestures[index],
+                                                                                expected)
+
+
+def randomHands(count, seed):
+    # integer pixel coordinates like HandDetector.setHands, half of them clustered so ties happen
+    rng = np.random.default_rng(seed)
+    handLandmarks = np.zeros((count, NUM_LANDMARKS, NUM_AXES))
+    spread = np.trunc(rng.random((count, NUM_LANDMARKS, 2)) * 400)
+    packed = np.trunc(rng.normal(200, 3, (count, NUM_LANDMARKS, 2)))
+    handLandmarks[:, :, :2] = np.where(np.arange(count)[:, None, None] % 2, spread, packed)
+    handLandmarks[:, :, 2]  = rng.normal(0.0, 0.1, (count, NUM_LANDMARKS))
+    handDirections = [DIRECTIONS[index] for index in rng.integers(len(DIRECTIONS), size=count)]
+    return handLandmarks, handDirections
+
+
+def test_randomHands():
+    assertSameGestures(*randomHands(RANDOM_HANDS, seed=0))
+
+
+def test_syntheticHands():
+    fixtures = syntheticFixtures(SYNTHETIC_HANDS, jitter=4.0, seed=1)
+    handLandmarks  = np.array([landmarks for landmarks, direction, gesture in fixtures])
+    handDirections = [direction for landmarks, direction, gesture in fixtures]
+    assertSameGestures(handLandmarks, handDirections)
+
+    # without jitter every pose is the gesture it was built for
+    clean = syntheticFixtures(len(DIRECTIONS) * 12, jitter=0.0)
+    gestures = HandClassifier(ORIGINAL_RULES).classifyHands(np.array([fixture[0] for fixture in clean]),
+                                                            [fixture[1] for fixture in clean])
+    assert gestures == [fixture[2] for fixture in clean]
+
+
+def test_classifyHandIdsMatchesGetGestureId():
+    handLandmarks, handDirections = randomHands(2000, seed=2)
+    classifier = HandClassifier()
+    gestureIds = classifier.classifyHandIds(handLandmarks, handDirections)
+    for landmarks, direction, gestureId in zip(handLandmarks, handDirections, gestureIds):
+        classifier.setHand(landmarks, direction)
+        assert classifier.getGestureId() == gestureId